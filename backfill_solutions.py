@@ -0,0 +1,34 @@
+import argparse
+import sys
+import time
+
+import puzzles_db
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Solve and store every puzzle of the puzzle database which has "
+                                                 "not been solved yet.")
+    parser.add_argument("-b", "--batch-size", type=int, default=puzzles_db.BACKFILL_BATCH,
+                        help=f"puzzles read from the database at a time (default: {puzzles_db.BACKFILL_BATCH})")
+    parser.add_argument("--db", default=puzzles_db.DB_PATH,
+                        help=f"database file (default: {puzzles_db.DB_PATH})")
+    args = parser.parse_args(argv)
+    if args.batch_size < 1:
+        parser.error("batch size must be positive")
+
+    conn = puzzles_db.connect(args.db)
+    try:
+        puzzles_db.initialize_db(conn)
+        start = time.perf_counter()
+        solved = puzzles_db.backfill_solutions(conn, args.batch_size)
+        elapsed = time.perf_counter() - start
+    finally:
+        conn.close()
+
+    rate = solved / elapsed if elapsed > 0 else 0.0
+    print(f"Solved {solved} puzzles in {elapsed:.2f} s ({rate:.0f} puzzles/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+import argparse
+import collections
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import puzzle_io
+import solution_cache
+import solver
+
+# Default number of puzzles sent to a worker at a time
+CHUNK_SIZE = 1000
+
+# Solution cache of the current process, created by the first chunk which asks for one
+_cache = None
+
+
+def solve_chunk(puzzles, engine, strategy, cache_size=0) -> list:
+    """
+    Solve a list of puzzles in a worker process.
+    :param cache_size: Size of the process' `solution_cache.SolutionCache`, 0 for no cache.
+    :return: List of the solutions, None for the puzzles without a solution.
+    """
+    global _cache
+    if cache_size:
+        if _cache is None:
+            _cache = solution_cache.SolutionCache(cache_size, engine, strategy)
+        return [_cache.solve(puzzle) for puzzle in puzzles]
+    return [solver.solve(puzzle, engine=engine, strategy=strategy) for puzzle in puzzles]
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def solve_file(in_path, out_path, workers=None, chunk_size=CHUNK_SIZE, engine="bitmask", strategy="mrv",
+               in_format=None, out_format=None, cache_size=0) -> tuple:
+    """
+    Solve the puzzles of a file in a process pool and write the solutions in the input
+    order. A puzzle without a solution is written back unchanged, so it still contains
+    empty cells. The puzzles are streamed: the next chunks are read while the workers
+    solve the previous ones, and at most two chunks per worker are in flight, so the
+    memory use does not depend on the size of the input.
+    :param in_path: Puzzle file, or "-" for the standard input.
+    :param out_path: Solution file, or "-" for the standard output.
+    :param workers: Number of worker processes, by default one per CPU core. With
+        one worker the puzzles are solved in this process.
+    :param in_format: Format of the input in `puzzle_io.FORMATS`, detected from the name by default.
+    :param out_format: Format of the output, detected from the name by default.
+    :param cache_size: Size of the solution cache of each worker, 0 for no cache.
+    :return: Tuple (number of puzzles, number of solved puzzles).
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = chunked(puzzle_io.read_puzzles(in_path, in_format), chunk_size)
+    writer = puzzle_io.WRITERS[out_format or puzzle_io.detect_format(out_path)]
+    out_file = puzzle_io.open_file(out_path, "wb")
+    total = 0
+    solved = 0
+
+    def write(puzzles, solutions):
+        nonlocal total, solved
+        for puzzle, solution in zip(puzzles, solutions):
+            total += 1
+            if solution is not None:
+                solved += 1
+            writer(out_file, solution or puzzle)
+
+    try:
+        if workers == 1:
+            for puzzles in chunks:
+                write(puzzles, solve_chunk(puzzles, engine, strategy, cache_size))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                pending = collections.deque()
+                for puzzles in chunks:
+                    pending.append((puzzles, executor.submit(solve_chunk, puzzles, engine, strategy,
+                                                                cache_size)))
+                    if len(pending) >= 2 * workers:
+                        puzzles, future = pending.popleft()
+                        write(puzzles, future.result())
+                while pending:
+                    puzzles, future = pending.popleft()
+                    write(puzzles, future.result())
+    finally:
+        if out_path == "-":
+            out_file.flush()
+        else:
+            out_file.close()
+    return total, solved
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Solve a file of sudoku puzzles.")
+    parser.add_argument("input", help="puzzle file, or - for standard input. Files ending with .gz are decompressed")
+    parser.add_argument("-o", "--output", default="-", help="solution file, or - for standard output (default)")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="number of worker processes (default: CPU count)")
+    parser.add_argument("-c", "--chunk-size", type=int, default=CHUNK_SIZE,
+                        help=f"puzzles sent to a worker at a time (default: {CHUNK_SIZE})")
+    parser.add_argument("--engine", choices=sorted(solver.ENGINES), default="bitmask")
+    parser.add_argument("--strategy", choices=sorted(solver.STRATEGIES), default="mrv")
+    parser.add_argument("--input-format", choices=puzzle_io.FORMATS, default=None,
+                        help="format of the input (default: from the file name, line format otherwise)")
+    parser.add_argument("--output-format", choices=puzzle_io.FORMATS, default=None,
+                        help="format of the output (default: from the file name, line format otherwise)")
+    parser.add_argument("--cache-size", type=int, default=0,
+                        help="solutions cached per worker, also for relabelled and reordered copies "
+                             "(default: 0, no cache)")
+    args = parser.parse_args(argv)
+    if args.chunk_size < 1 or (args.workers is not None and args.workers < 1):
+        parser.error("chunk size and workers must be positive")
+    if args.cache_size < 0:
+        parser.error("cache size can not be negative")
+
+    start = time.perf_counter()
+    total, solved = solve_file(args.input, args.output, args.workers, args.chunk_size, args.engine, args.strategy,
+                               args.input_format, args.output_format, args.cache_size)
+    elapsed = time.perf_counter() - start
+
+    rate = total / elapsed if elapsed > 0 else 0.0
+    print(f"Solved {solved}/{total} puzzles in {elapsed:.2f} s ({rate:.0f} puzzles/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
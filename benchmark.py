@@ -0,0 +1,188 @@
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import canonical
+import puzzle_io
+import settings
+import solver
+
+# Solver configurations benchmarked by default as "engine:strategy" or
+# "engine:strategy:passes", where the passes are names from `solver.PASSES` joined
+# with "+", or "all". "bitmask:first" is the default of `solver.solve`.
+DEFAULT_CONFIGS = ["bitmask:first", "bitmask:mrv", "bitmask:mrv:locked", "bitmask:mrv:all", "dlx:mrv"]
+# Seconds after which a solve is stopped. The plain "bitmask:first" backtracking takes
+# minutes on the anti backtracking puzzle, which is reported as a timeout instead.
+DEFAULT_TIMEOUT = 10.0
+# Presets which are always benchmarked and reported on their own
+WORST_CASES = ["anti backtracking", "impossible"]
+
+
+def generated_corpus(size, seed):
+    """
+    Build a reproducible corpus of `size` puzzles by applying random symmetries to
+    the preset puzzles which have a solution.
+    """
+    rnd = random.Random(seed)
+    sources = [puzzle for name, puzzle in settings.preset_puzzles.items() if name not in ("empty", "impossible")]
+    return [canonical.Transform.random(rnd).apply(rnd.choice(sources)) for _ in range(size)]
+
+
+def parse_config(config) -> tuple:
+    """
+    Split a configuration string into a tuple (engine, strategy, passes).
+    """
+    engine, _, rest = config.partition(":")
+    strategy, _, passes = rest.partition(":")
+    if passes == "all":
+        return engine, strategy, list(solver.PASSES)
+    return engine, strategy, passes.split("+") if passes else []
+
+
+def percentile(values, p):
+    """
+    Nearest-rank percentile of a sorted list.
+    """
+    if not values:
+        return 0.0
+    rank = max(0, math.ceil(p / 100 * len(values)) - 1)
+    return values[rank]
+
+
+def measure(puzzles, engine, strategy, repeat, passes=(), timeout=DEFAULT_TIMEOUT) -> list:
+    """
+    Solve every puzzle `repeat` times and collect the best time, the number of
+    search nodes and the `solver.SolveStats` status. The nodes are counted in a
+    separate run so that collecting the statistics does not slow down the timed runs.
+    A puzzle whose solve takes longer than `timeout` seconds is not timed again, it
+    is reported with the status "timeout" and the time it ran.
+    """
+    results = []
+    for puzzle in puzzles:
+        _, stats = solver.solve(puzzle, engine=engine, strategy=strategy, stats=True, passes=passes,
+                                timeout=timeout)
+        best = stats.total_time
+        if stats.status != "timeout":
+            for _ in range(repeat):
+                start = time.perf_counter()
+                solver.solve(puzzle, engine=engine, strategy=strategy, passes=passes, timeout=timeout)
+                best = min(best, time.perf_counter() - start)
+        results.append({"seconds": best, "nodes": stats.nodes, "status": stats.status})
+    return results
+
+
+def peak_memory(puzzles, engine, strategy, passes=(), timeout=DEFAULT_TIMEOUT) -> int:
+    """
+    Return the peak memory allocated while solving the puzzles once, in bytes.
+    """
+    tracemalloc.start()
+    try:
+        for puzzle in puzzles:
+            solver.solve(puzzle, engine=engine, strategy=strategy, passes=passes, timeout=timeout)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def summarize(results) -> dict:
+    latencies = sorted(result["seconds"] for result in results)
+    nodes = [result["nodes"] for result in results]
+    total_time = sum(latencies)
+    return {
+        "puzzles": len(results),
+        "solved": sum(result["status"] == "solved" for result in results),
+        "timeouts": sum(result["status"] == "timeout" for result in results),
+        "puzzles_per_second": len(results) / total_time if total_time else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 50) * 1000,
+            "p95": percentile(latencies, 95) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+            "max": (latencies[-1] if latencies else 0.0) * 1000,
+        },
+        "nodes": {"total": sum(nodes), "max": max(nodes, default=0)},
+    }
+
+
+def run_benchmark(corpora, configs, repeat=3, timeout=DEFAULT_TIMEOUT) -> dict:
+    """
+    Benchmark each solver configuration on each corpus.
+    :param corpora: Dict of corpus name to list of puzzles.
+    :param configs: List of configuration strings, see `DEFAULT_CONFIGS`.
+    :param repeat: Number of timed runs per puzzle, the fastest one is reported.
+    :param timeout: Seconds after which a solve is stopped and reported as a timeout.
+    :return: Report which can be dumped as JSON.
+    """
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "timeout": timeout,
+        "results": [],
+    }
+    for config in configs:
+        engine, strategy, passes = parse_config(config)
+        for corpus, puzzles in corpora.items():
+            results = measure(puzzles, engine, strategy, repeat, passes, timeout)
+            summary = {"engine": engine, "strategy": strategy, "passes": passes, "corpus": corpus}
+            summary.update(summarize(results))
+            summary["peak_memory_kb"] = peak_memory(puzzles, engine, strategy, passes, timeout) / 1024
+            report["results"].append(summary)
+
+        worst = {}
+        for name in WORST_CASES:
+            result = measure([settings.preset_puzzles[name]], engine, strategy, repeat, passes, timeout)[0]
+            worst[name] = {"latency_ms": result["seconds"] * 1000, "nodes": result["nodes"],
+                           "status": result["status"]}
+        report["results"].append({"engine": engine, "strategy": strategy, "passes": passes, "corpus": "worst cases",
+                                  "puzzles": worst})
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the sudoku solver and print a JSON report.")
+    parser.add_argument("--config", action="append", default=None,
+                        help="solver configuration as engine:strategy[:passes], can be repeated "
+                             f"(default: {' '.join(DEFAULT_CONFIGS)})")
+    parser.add_argument("--generated", type=int, default=1000,
+                        help="number of puzzles generated from the presets (default: 1000)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the generated corpus (default: 0)")
+    parser.add_argument("--corpus", action="append", default=[], help="puzzle file to benchmark, can be repeated")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per puzzle (default: 3)")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help=f"seconds after which a solve is stopped (default: {DEFAULT_TIMEOUT:g})")
+    parser.add_argument("-o", "--output", default="-", help="JSON report file, or - for standard output (default)")
+    args = parser.parse_args(argv)
+
+    configs = args.config or DEFAULT_CONFIGS
+    for config in configs:
+        engine, strategy, passes = parse_config(config)
+        if engine not in solver.ENGINES or strategy not in solver.STRATEGIES or \
+                any(name not in solver.PASSES for name in passes):
+            parser.error(f"invalid configuration {config!r}")
+    if args.timeout <= 0:
+        parser.error("timeout must be positive")
+
+    corpora = {"presets": list(settings.preset_puzzles.values())}
+    if args.generated:
+        corpora[f"generated (seed {args.seed})"] = generated_corpus(args.generated, args.seed)
+    for path in args.corpus:
+        corpora[path] = list(puzzle_io.read_puzzles(path))
+
+    report = run_benchmark(corpora, configs, args.repeat, args.timeout)
+    report["seed"] = args.seed
+    text = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+import itertools
+import math
+
+# Canonical form of a puzzle under the sudoku symmetries: relabelling the digits,
+# reordering the bands, the stacks, the rows inside a band and the columns inside
+# a stack, and transposing. Two puzzles have the same canonical form exactly when
+# one can be turned into the other by these operations.
+#
+# Trying all of the 2 * 6^8 arrangements is far too slow, so the rows and columns are
+# first sorted by signatures which do not change under the symmetries. Only the
+# arrangements which the signatures can not tell apart are tried, and the smallest
+# of them, with the digits relabelled in order of appearance, is the canonical form.
+
+# Highest number of arrangements tried before giving up, reached only by very
+# symmetric puzzles such as the empty one
+MAX_ARRANGEMENTS = 20000
+
+
+class Transform:
+    """
+    A sudoku symmetry. `apply` transposes the puzzle if `transposed` is set, then takes
+    its rows in the order `rows` and its columns in the order `cols` and relabels the
+    digits with `relabel`, a list mapping each old digit to the new one.
+    """
+    def __init__(self, transposed, rows, cols, relabel):
+        self.transposed = transposed
+        self.rows = list(rows)
+        self.cols = list(cols)
+        self.relabel = list(relabel)
+
+    @classmethod
+    def random(cls, rnd):
+        """
+        Return a random symmetry drawn with the random.Random instance `rnd`.
+        """
+        digits = list(range(1, 10))
+        rnd.shuffle(digits)
+
+        def order():
+            bands = rnd.sample(range(3), 3)
+            return [3 * band + line for band in bands for line in rnd.sample(range(3), 3)]
+
+        return cls(rnd.random() < 0.5, order(), order(), [0] + digits)
+
+    def apply(self, puzzle):
+        grid = _transpose(puzzle) if self.transposed else puzzle
+        relabel = self.relabel
+        return [[relabel[grid[i][j]] for j in self.cols] for i in self.rows]
+
+    def invert(self, puzzle):
+        """
+        Undo `apply`, for example to map the solution of a canonical puzzle back.
+        """
+        original = [0] * 10
+        for digit, label in enumerate(self.relabel):
+            original[label] = digit
+        grid = [[0] * 9 for _ in range(9)]
+        for i, row in zip(self.rows, puzzle):
+            grid_row = grid[i]
+            for j, value in zip(self.cols, row):
+                grid_row[j] = original[value]
+        return _transpose(grid) if self.transposed else grid
+
+
+def canonicalize(puzzle, max_arrangements=MAX_ARRANGEMENTS):
+    """
+    Find the canonical form of a puzzle.
+    :param puzzle: List containing the lists of values of the each row, 0 for empty cells.
+    :param max_arrangements: Give up if more arrangements than this would have to be tried.
+    :return: Tuple (key, transform) where `key` is the canonical form as 81 bytes and
+        `transform.apply(puzzle)` gives the canonical puzzle. None if the puzzle is too
+        symmetric to canonicalize within `max_arrangements`, or is not a 9x9 puzzle.
+    """
+    if len(puzzle) != 9:
+        return None
+    transposed_puzzle = _transpose(puzzle)
+    row_counts = [9 - row.count(0) for row in puzzle]
+    col_counts = [9 - col.count(0) for col in transposed_puzzle]
+    # The rows of the transposed puzzle are the columns of the puzzle, so the
+    # orders are only computed once for each
+    row_orders = _orders(puzzle, col_counts)
+    col_orders = _orders(transposed_puzzle, row_counts)
+    row_count = _count(row_orders)
+    col_count = _count(col_orders)
+    if 2 * row_count * col_count > max_arrangements:
+        return None
+    row_choices = _expand(row_orders, row_count)
+    col_choices = _expand(col_orders, col_count)
+    candidates = [(False, puzzle, row_choices, col_choices), (True, transposed_puzzle, col_choices, row_choices)]
+
+    best = None
+    best_arrangement = None
+    for transposed, grid, row_choices, col_choices in candidates:
+        for rows in row_choices:
+            for cols in col_choices:
+                labelled = _relabelled(grid, rows, cols, best)
+                if labelled is not None:
+                    best = labelled
+                    best_arrangement = (transposed, rows, cols)
+
+    transposed, rows, cols = best_arrangement
+    grid = transposed_puzzle if transposed else puzzle
+    relabel = [0] * 10
+    next_label = 1
+    for i in rows:
+        for j in cols:
+            value = grid[i][j]
+            if value and not relabel[value]:
+                relabel[value] = next_label
+                next_label += 1
+    # Digits missing from the puzzle get the remaining labels in increasing order
+    for digit in range(1, 10):
+        if not relabel[digit]:
+            relabel[digit] = next_label
+            next_label += 1
+    return bytes(best), Transform(transposed, rows, cols, relabel)
+
+
+def _transpose(puzzle):
+    return [list(col) for col in zip(*puzzle)]
+
+
+def _orders(grid, col_counts):
+    """
+    Sort the bands and the rows inside each band by signatures which do not change
+    when the columns are reordered or the digits relabelled.
+    :param col_counts: Number of givens in each column of the grid.
+    :return: List of 3 bands, each a list of groups of bands which have equal signatures,
+        in sorted order. Each band is a list of the groups of its rows in the same way.
+    """
+    # The signature of a row is the sorted multisets of the column counts of its givens
+    # in each stack. A multiset is encoded as an integer with one 4-bit digit per count.
+    weights = [1 << 4 * count for count in col_counts]
+    row_signatures = []
+    for row in grid:
+        a = (weights[0] if row[0] else 0) + (weights[1] if row[1] else 0) + (weights[2] if row[2] else 0)
+        b = (weights[3] if row[3] else 0) + (weights[4] if row[4] else 0) + (weights[5] if row[5] else 0)
+        c = (weights[6] if row[6] else 0) + (weights[7] if row[7] else 0) + (weights[8] if row[8] else 0)
+        # Sorting network of the three stacks
+        if a > b:
+            a, b = b, a
+        if b > c:
+            b, c = c, b
+            if a > b:
+                a, b = b, a
+        row_signatures.append((a, b, c))
+
+    bands = []
+    for band in range(3):
+        rows = sorted(range(3 * band, 3 * band + 3), key=row_signatures.__getitem__)
+        bands.append((tuple(row_signatures[i] for i in rows), _group(rows, row_signatures.__getitem__)))
+    bands.sort(key=lambda band: band[0])
+    return _group(bands, lambda band: band[0])
+
+
+def _group(items, key):
+    return [list(group) for _, group in itertools.groupby(items, key)]
+
+
+def _count(band_groups) -> int:
+    count = 1
+    for group in band_groups:
+        count *= math.factorial(len(group))
+        for _, row_groups in group:
+            for rows in row_groups:
+                count *= math.factorial(len(rows))
+    return count
+
+
+def _expand(band_groups, count) -> list:
+    """
+    List every order of the rows allowed by the groups from `_orders`.
+    :param count: Number of orders from `_count`.
+    """
+    if count == 1:
+        # Every group has one member, which is the case for most puzzles
+        return [[i for group in band_groups for _, row_groups in group for rows in row_groups for i in rows]]
+    orders = []
+    band_choices = [list(itertools.permutations(group)) for group in band_groups]
+    for bands in itertools.product(*band_choices):
+        bands = [band for group in bands for band in group]
+        row_choices = [itertools.product(*(itertools.permutations(rows) for rows in row_groups))
+                       for _, row_groups in bands]
+        for band_orders in itertools.product(*(list(choice) for choice in row_choices)):
+            orders.append([i for band in band_orders for rows in band for i in rows])
+    return orders
+
+
+def _relabelled(grid, rows, cols, best):
+    """
+    Arrange the grid and relabel the digits in order of appearance.
+    :return: The arranged values as a list, or None if they are not smaller than `best`.
+    """
+    labels = [0] * 10
+    next_label = 1
+    values = []
+    smaller = best is None
+    for i in rows:
+        row = grid[i]
+        for j in cols:
+            value = row[j]
+            if value:
+                label = labels[value]
+                if not label:
+                    label = labels[value] = next_label
+                    next_label += 1
+                value = label
+            if not smaller:
+                other = best[len(values)]
+                if value > other:
+                    return None
+                smaller = value < other
+            values.append(value)
+    return values if smaller else None
@@ -0,0 +1,209 @@
+import argparse
+import collections
+import itertools
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import canonical
+import puzzles_db
+import solver
+
+# Number of puzzles generated by a worker at a time
+CHUNK_SIZE = 10
+# Number of generated puzzles written to the database per transaction
+DB_BATCH = 100
+# Full grids tried for one puzzle before giving up on the target
+MAX_ATTEMPTS = 100
+# Seeds in a row which may give no new puzzle before `generate` gives up on the targets
+MAX_FAILED_SEEDS = 10
+# Fewest givens a puzzle with a unique solution can have
+MIN_GIVENS = 17
+
+
+def random_grid(rnd):
+    """
+    Build a random full grid. The three squares on the diagonal do not share any
+    row or column, so they can be filled with random permutations before the
+    solver completes the grid, and a random symmetry is applied to the result.
+    :param rnd: random.Random instance.
+    """
+    grid = [[0] * 9 for _ in range(9)]
+    for square in range(3):
+        for n, value in enumerate(rnd.sample(range(1, 10), 9)):
+            grid[3 * square + n // 3][3 * square + n % 3] = value
+    solution = solver.solve(grid, strategy="mrv")
+    return canonical.Transform.random(rnd).apply(solution)
+
+
+def remove_clues(solution, rnd, target_givens=0, min_nodes=0):
+    """
+    Empty the cells of a full grid in random order, keeping only the removals after
+    which the puzzle still has a unique solution.
+    :param target_givens: Stop when only this many givens are left.
+    :param min_nodes: Stop when solving the puzzle takes at least this many search
+        nodes with the "mrv" strategy, 0 to ignore the difficulty.
+    :return: Tuple (puzzle, reached) where `reached` tells if one of the targets was
+        reached. If not, no given can be removed without losing the uniqueness.
+    """
+    puzzle = [row.copy() for row in solution]
+    givens = 81
+    for k in rnd.sample(range(81), 81):
+        if givens <= target_givens:
+            return puzzle, True
+        i, j = divmod(k, 9)
+        value = puzzle[i][j]
+        puzzle[i][j] = 0
+        if solver.count_solutions(puzzle) != 1:
+            puzzle[i][j] = value
+            continue
+        givens -= 1
+        if min_nodes and solver.solve(puzzle, strategy="mrv", stats=True)[1].nodes >= min_nodes:
+            return puzzle, True
+    return puzzle, givens <= target_givens
+
+
+def generate_puzzle(seed, target_givens=None, min_nodes=0, attempts=MAX_ATTEMPTS):
+    """
+    Generate one puzzle with a unique solution. The result only depends on the seed.
+    :param seed: Seed of the random.Random instance used.
+    :param target_givens: Highest number of givens accepted. By default as many givens
+        as possible are removed and the puzzle is accepted whatever is left.
+    :param min_nodes: Lowest difficulty accepted, as search nodes of the "mrv" strategy.
+    :param attempts: Number of full grids tried before giving up.
+    :return: The puzzle, or None if no grid reached the targets.
+    """
+    if target_givens is not None and target_givens < MIN_GIVENS:
+        raise ValueError(f"No puzzle with fewer than {MIN_GIVENS} givens has a unique solution")
+    rnd = random.Random(seed)
+    for _ in range(attempts):
+        puzzle, reached = remove_clues(random_grid(rnd), rnd, target_givens or 0, min_nodes)
+        if reached or (target_givens is None and not min_nodes):
+            return puzzle
+    return None
+
+
+def generate_chunk(seeds, target_givens, min_nodes) -> list:
+    return [generate_puzzle(seed, target_givens, min_nodes) for seed in seeds]
+
+
+def generate(count, seed=0, target_givens=None, min_nodes=0, workers=None, chunk_size=CHUNK_SIZE,
+             max_failures=MAX_FAILED_SEEDS):
+    """
+    Generate `count` distinct puzzles in a process pool. Puzzle number n is generated
+    from the seed "<seed>/<n>", so the output is the same for any number of workers.
+    Puzzles which are a relabelled, transposed or reordered copy of an earlier one
+    are skipped and replaced by the next seeds.
+    :param workers: Number of worker processes, by default one per CPU core. With
+        one worker the puzzles are generated in this process.
+    :param max_failures: Number of seeds in a row which may give no new puzzle, because
+        none of their grids reached the targets or the puzzle was a copy.
+    :return: Generator of the puzzles.
+    :raises RuntimeError: If `max_failures` seeds in a row gave no new puzzle. The
+        puzzles generated before are still yielded.
+    """
+    workers = workers or os.cpu_count() or 1
+    seeds = (f"{seed}/{n}" for n in itertools.count())
+    chunks = (list(itertools.islice(seeds, chunk_size)) for _ in itertools.count())
+    seen = set()
+    produced = 0
+    failures = 0
+
+    def distinct(puzzles):
+        nonlocal produced, failures
+        for puzzle in puzzles:
+            if produced >= count:
+                return
+            key = None
+            if puzzle is not None:
+                canonical_form = canonical.canonicalize(puzzle)
+                key = canonical_form[0] if canonical_form else bytes(value for row in puzzle for value in row)
+            if key is None or key in seen:
+                failures += 1
+                if failures >= max_failures:
+                    raise RuntimeError(f"No new puzzle reached the targets in {failures} seeds in a row")
+                continue
+            seen.add(key)
+            produced += 1
+            failures = 0
+            yield puzzle
+
+    if workers == 1:
+        for chunk in chunks:
+            if produced >= count:
+                return
+            yield from distinct(generate_chunk(chunk, target_givens, min_nodes))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        try:
+            for chunk in chunks:
+                pending.append(executor.submit(generate_chunk, chunk, target_givens, min_nodes))
+                if len(pending) >= 2 * workers:
+                    yield from distinct(pending.popleft().result())
+                    if produced >= count:
+                        return
+        finally:
+            # Do not wait for the chunks which are no longer needed
+            for future in pending:
+                future.cancel()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generate sudoku puzzles with a unique solution into the "
+                                                 "puzzle database.")
+    parser.add_argument("count", type=int, help="number of puzzles to generate")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+    parser.add_argument("--givens", type=int, default=None,
+                        help="highest number of givens (default: remove as many as possible)")
+    parser.add_argument("--min-nodes", type=int, default=0,
+                        help="lowest difficulty as search nodes of the mrv backtracking (default: 0)")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="number of worker processes (default: CPU count)")
+    parser.add_argument("--name", default=None,
+                        help="prefix of the puzzle names, numbered after the ones already stored with it "
+                             "(default: generated <seed>)")
+    parser.add_argument("--db", default=puzzles_db.DB_PATH, help=f"database file (default: {puzzles_db.DB_PATH})")
+    args = parser.parse_args(argv)
+    if args.count < 1 or (args.workers is not None and args.workers < 1):
+        parser.error("count and workers must be positive")
+    if args.givens is not None and args.givens < MIN_GIVENS:
+        parser.error(f"a puzzle needs at least {MIN_GIVENS} givens")
+
+    failure = None
+
+    def until_failure(puzzles):
+        # Stop the stream instead of raising, so that the puzzles generated before are stored
+        nonlocal failure
+        try:
+            yield from puzzles
+        except RuntimeError as error:
+            failure = error
+
+    conn = puzzles_db.connect(args.db)
+    try:
+        puzzles_db.initialize_db(conn)
+        start = time.perf_counter()
+        puzzles = until_failure(generate(args.count, args.seed, args.givens, args.min_nodes, args.workers))
+        generated, added = puzzles_db.add_puzzles(puzzles, args.name or f"generated {args.seed}", DB_BATCH,
+                                                  solutions=1, conn=conn)
+        elapsed = time.perf_counter() - start
+    finally:
+        conn.close()
+
+    rate = generated / elapsed * 3600 if elapsed > 0 else 0.0
+    print(f"Generated {generated} puzzles, added {added} new, skipped {generated - added} already stored, "
+          f"in {elapsed:.2f} s ({rate:.0f} puzzles/hour)", file=sys.stderr)
+    if failure is not None:
+        print(f"{failure}, raise --givens or lower --min-nodes", file=sys.stderr)
+        return 1
+    # The same seed and targets generate the same puzzles again
+    if added < generated:
+        print("Some puzzles were already stored, use another --seed", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+import argparse
+import collections
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import batch_solve
+import puzzle_io
+import puzzles_db
+import solver
+
+# Default number of puzzles sent to a worker at a time
+CHUNK_SIZE = 100
+
+
+def fill_naked(candidates, grid, rows, cols, boxes, queue) -> int:
+    """
+    Fill every cell with a single candidate.
+    :return: Number of cells filled.
+    """
+    singles = [k for k, mask in enumerate(candidates) if mask is not None and solver.BIT_COUNT[mask] == 1]
+    return solver.fill_unique(candidates, grid, rows, cols, boxes, queue, singles)
+
+
+def eliminating(eliminate_pass):
+    """
+    Use an elimination pass from `solver.PASSES` as a technique. Its progress is
+    counted in candidates removed instead of cells filled.
+    """
+    def technique(candidates, grid, rows, cols, boxes, queue):
+        return eliminate_pass(candidates)
+    return technique
+
+
+# Solving techniques from the weakest to the strongest with their difficulty. The
+# grader always applies the weakest technique which makes progress, and falls back
+# to the search only when none of them does.
+TECHNIQUES = collections.OrderedDict([
+    ("hidden single square", (solver.fill_square, 10)),
+    ("hidden single row", (solver.fill_row, 12)),
+    ("hidden single col", (solver.fill_col, 12)),
+    ("naked single", (fill_naked, 15)),
+    ("locked candidates", (eliminating(solver.locked_candidates), 25)),
+    ("naked pair", (eliminating(solver.naked_pairs), 30)),
+    ("hidden pair", (eliminating(solver.hidden_pairs), 35)),
+    ("naked triple", (eliminating(solver.naked_triples), 40)),
+    ("hidden triple", (eliminating(solver.hidden_triples), 45)),
+    ("x-wing", (eliminating(solver.x_wing), 50)),
+    ("swordfish", (eliminating(solver.swordfish), 60)),
+])
+SEARCH = "search"
+SEARCH_SCORE = 100
+# Difficulty levels by the highest score they include, the names match the presets
+LEVELS = [(12, "easy"), (15, "normal"), (SEARCH_SCORE - 1, "hard"), (SEARCH_SCORE, "very hard")]
+
+
+def grade(puzzle) -> dict:
+    """
+    Grade a puzzle by solving it like a person would: every step applies the weakest
+    technique in `TECHNIQUES` which makes progress. If no technique helps the rest
+    is searched.
+    :param puzzle: List containing the lists of values of the each row, 0 for empty cells.
+    :return: Dict with the "status" ("solved" or "unsolvable"), the number of
+        "solutions" (0, 1 or 2 for several), the "score" of the hardest technique
+        needed, its "level" and the "techniques" used with the number of cells each
+        filled or candidates each removed. A search is counted in nodes. The techniques
+        are only graded on 9x9 boards, other sizes get no score or level.
+    """
+    result = {"status": "unsolvable", "solutions": solver.count_solutions(puzzle), "score": 0, "level": None,
+              "techniques": {}}
+    if not result["solutions"]:
+        return result
+    if len(puzzle) != 9:
+        result["status"] = "solved"
+        return result
+    # The techniques are sound, so they can not run into a contradiction on a
+    # puzzle which has a solution
+    grid = [value for row in puzzle for value in row]
+    rows, cols, boxes = solver.init_masks(grid)
+    candidates = solver.get_candidates(grid, rows, cols, boxes)
+    used = result["techniques"]
+    queue = []
+    while 0 in grid:
+        for name, (technique, score) in TECHNIQUES.items():
+            filled = technique(candidates, grid, rows, cols, boxes, queue)
+            if filled:
+                used[name] = used.get(name, 0) + filled
+                result["score"] = max(result["score"], score)
+                break
+        else:
+            stats = solver.SolveStats("bitmask")
+            solver.backtracking(grid, rows, cols, boxes, select_cell=solver.select_most_constrained, stats=stats)
+            used[SEARCH] = stats.nodes
+            result["score"] = SEARCH_SCORE
+            break
+        solver.eliminate(candidates, grid, queue)
+
+    result["status"] = "solved"
+    result["level"] = level(result["score"])
+    return result
+
+
+def level(score) -> str:
+    for highest, name in LEVELS:
+        if score <= highest:
+            return name
+    return LEVELS[-1][1]
+
+
+def grade_chunk(puzzles) -> list:
+    return [grade(puzzle) for puzzle in puzzles]
+
+
+def grade_all(puzzles, workers=None, chunk_size=CHUNK_SIZE):
+    """
+    Grade the puzzles of an iterable in a process pool, keeping at most two chunks
+    per worker in flight.
+    :param workers: Number of worker processes, by default one per CPU core. With
+        one worker the puzzles are graded in this process.
+    :return: Generator of the grades in the input order.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = batch_solve.chunked(puzzles, chunk_size)
+    if workers == 1:
+        for chunk in chunks:
+            yield from grade_chunk(chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(executor.submit(grade_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def grade_db(conn, workers=None, chunk_size=CHUNK_SIZE) -> int:
+    """
+    Grade every puzzle of the database which has not been graded yet and store the grades.
+    :return: Number of puzzles graded.
+    """
+    graded = 0
+    after_id = 0
+    while True:
+        rows = puzzles_db.ungraded_puzzles(after_id, conn=conn)
+        if not rows:
+            return graded
+        ids = [id for id, _ in rows]
+        grades = grade_all((puzzle for _, puzzle in rows), workers, chunk_size)
+        puzzles_db.save_grades(zip(ids, grades), conn)
+        graded += len(rows)
+        after_id = ids[-1]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Grade the difficulty of sudoku puzzles by the solving techniques "
+                                                 "they need.")
+    parser.add_argument("input", nargs="?", default=None,
+                        help="puzzle file to grade, or - for standard input (default: grade the database)")
+    parser.add_argument("-o", "--output", default="-",
+                        help="file for the grades of the input as JSON lines, or - for standard output (default)")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="number of worker processes (default: CPU count)")
+    parser.add_argument("-c", "--chunk-size", type=int, default=CHUNK_SIZE,
+                        help=f"puzzles sent to a worker at a time (default: {CHUNK_SIZE})")
+    parser.add_argument("--format", choices=puzzle_io.FORMATS, default=None,
+                        help="format of the input (default: from the file name, line format otherwise)")
+    parser.add_argument("--db", default=puzzles_db.DB_PATH,
+                        help=f"database graded when no input is given (default: {puzzles_db.DB_PATH})")
+    args = parser.parse_args(argv)
+    if args.chunk_size < 1 or (args.workers is not None and args.workers < 1):
+        parser.error("chunk size and workers must be positive")
+
+    start = time.perf_counter()
+    if args.input is None:
+        conn = puzzles_db.connect(args.db)
+        try:
+            puzzles_db.initialize_db(conn)
+            total = grade_db(conn, args.workers, args.chunk_size)
+        finally:
+            conn.close()
+    else:
+        total = 0
+        out_file = puzzle_io.open_file(args.output, "wb")
+        try:
+            for result in grade_all(puzzle_io.read_puzzles(args.input, args.format), args.workers, args.chunk_size):
+                out_file.write(json.dumps(result).encode() + b"\n")
+                total += 1
+        finally:
+            if args.output == "-":
+                out_file.flush()
+            else:
+                out_file.close()
+    elapsed = time.perf_counter() - start
+
+    rate = total / elapsed if elapsed > 0 else 0.0
+    print(f"Graded {total} puzzles in {elapsed:.2f} s ({rate:.0f} puzzles/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+import argparse
+import sys
+import time
+
+import puzzle_io
+import puzzles_db
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Import a file of sudoku puzzles into the puzzle database.")
+    parser.add_argument("input", help="puzzle file, or - for standard input. Files ending with .gz are decompressed")
+    parser.add_argument("--format", choices=puzzle_io.FORMATS, default=None,
+                        help="format of the input (default: from the file name, line format otherwise)")
+    parser.add_argument("--name", default=None,
+                        help="prefix of the puzzle names, numbered after the ones already stored with it "
+                             "(default: the file name)")
+    parser.add_argument("-b", "--batch-size", type=int, default=puzzles_db.IMPORT_BATCH,
+                        help=f"puzzles inserted per transaction (default: {puzzles_db.IMPORT_BATCH})")
+    parser.add_argument("--db", default=puzzles_db.DB_PATH,
+                        help=f"database file (default: {puzzles_db.DB_PATH})")
+    args = parser.parse_args(argv)
+    if args.batch_size < 1:
+        parser.error("batch size must be positive")
+
+    conn = puzzles_db.connect(args.db)
+    try:
+        puzzles_db.initialize_db(conn)
+        start = time.perf_counter()
+        read, added = puzzles_db.import_puzzles(args.input, args.format, args.name, args.batch_size, conn)
+        elapsed = time.perf_counter() - start
+    finally:
+        conn.close()
+
+    rate = read / elapsed if elapsed > 0 else 0.0
+    print(f"Imported {added} new of {read} puzzles, skipped {read - added} already stored, in {elapsed:.2f} s "
+          f"({rate:.0f} rows/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
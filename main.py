@@ -1,3 +1,4 @@
+import math
 import os
 
 import pygame
@@ -10,9 +11,52 @@ except ImportError:  # python 2
     import Tkinter as tk
     from Tkinter import messagebox
 
+import puzzle_io
 import puzzles_db
-from solver import solve, is_possible, check_solution
-import solver_visual
+import solver
+from solver import count_solutions, is_possible, check_solution
+from solve_worker import SolveWorker
+
+# Areas of the screen drawn since the last display update
+_dirty_rects = []
+# Rendered text surfaces by (text, size, color) and fonts by size
+_glyphs = {}
+_fonts = {}
+
+
+def mark_dirty(rect) -> None:
+    _dirty_rects.append(rect)
+
+
+def flush_display() -> None:
+    """
+    Push the areas drawn since the last call to the display in one update.
+    """
+    if _dirty_rects:
+        pygame.display.update(_dirty_rects)
+        _dirty_rects.clear()
+
+
+# Background colours of the cells filled by each of the singles rules in a replay
+TECHNIQUE_COLORS = {solver.TRACE_UNIQUE: settings.BLUE,
+                    solver.TRACE_SQUARE: settings.LIGHT_BLUE,
+                    solver.TRACE_ROW: settings.LIGHT_BLUE,
+                    solver.TRACE_COL: settings.LIGHT_BLUE,
+                    }
+
+
+def render_text(text, size, color):
+    """
+    Return the text rendered with the game font, rendering each combination only once.
+    """
+    key = (text, size, color)
+    glyph = _glyphs.get(key)
+    if glyph is None:
+        font = _fonts.get(size)
+        if font is None:
+            font = _fonts[size] = pygame.font.SysFont("comicsans", size)
+        glyph = _glyphs[key] = font.render(text, True, color)
+    return glyph
 
 
 class Board:
@@ -20,21 +64,39 @@ class Board:
         self.screen = screen
         self.width = settings.width
         self.height = settings.height
-        self.puzzle = puzzles_db.load_puzzle(1)
+        # Database id of the loaded puzzle, None for a puzzle which has not been saved
+        self.puzzle_id = 1
+        self.puzzle = puzzles_db.load_puzzle(self.puzzle_id)
         self._current_puzzle = None
-        self.cells = [[Cell(self.puzzle[i][j], i, j, self.width, self.height, self.screen) for j in range(9)] for i in
-                      range(9)]
+        # `solver.Cages` of a killer sudoku, None for a classic puzzle
+        self.cages = None
+        # Number of rows and columns, and of the rows and columns of a square
+        self.size = len(self.puzzle)
+        self.box = math.isqrt(self.size)
+        self.cells = self.create_cells()
         self.selected_cell = (0, 0)
+        # Solves started with Space run in a worker process
+        self.solver = SolveWorker()
+        # Visual solves are traced in the worker and replayed from a `solve_replay.Replay`
+        self.replay = None
+        self.replay_position = 0.0
+        self.replay_speed = settings.REPLAY_SPEED
+        self.replay_paused = False
 
         # Initializing values
         self.cells[0][0].is_selected = True
         # Creating a deepcopy of self.puzzle by using current_puzzle setter property
         self.current_puzzle = self.puzzle
+        self.set_cages(puzzles_db.load_cages(self.puzzle_id))
 
     @property
     def current_puzzle(self):
         return self._current_puzzle
 
+    @property
+    def cell_size(self) -> int:
+        return self.width // self.size
+
     @current_puzzle.setter
     def current_puzzle(self, puzzle):
         self._current_puzzle = copy.deepcopy(puzzle)
@@ -51,11 +113,15 @@ class Board:
         # TODO: both puzzle and solution are None?
         # TODO: is clear initials required? solution is enough?
         if puzzle:
+            # A running solve or a replay is for the previous puzzle
+            self.discard_solve()
+            if len(puzzle) != self.size:
+                self.set_size(len(puzzle))
             self.puzzle = puzzle
             self.current_puzzle = self.puzzle
         self.clear_cells(clear_initials=clear_initials)
-        for i in range(9):
-            for j in range(9):
+        for i in range(self.size):
+            for j in range(self.size):
                 if self.puzzle[i][j]:
                     self.cells[i][j].has_initial_value = True
                 if solution is None:
@@ -66,25 +132,75 @@ class Board:
             self.current_puzzle = solution
         self.update_board(self.screen)
 
+    def create_cells(self) -> list:
+        return [[Cell(self.puzzle[i][j], i, j, self.width, self.height, self.screen, self.size)
+                 for j in range(self.size)] for i in range(self.size)]
+
+    def set_size(self, size) -> None:
+        """
+        Replace the board with an empty board of `size` x `size` cells.
+        :param size: One of `solver.SIZES`.
+        """
+        self.discard_solve()
+        self.size = size
+        self.box = math.isqrt(size)
+        self.cages = None
+        self.puzzle = [[0 for _ in range(size)] for _ in range(size)]
+        self.current_puzzle = self.puzzle
+        self.cells = self.create_cells()
+        self.selected_cell = (0, 0)
+        self.cells[0][0].is_selected = True
+        # The cells of the new size may not cover the board to its edges
+        board = pygame.Rect(0, 0, self.width, self.height)
+        pygame.draw.rect(self.screen, settings.WHITE, board)
+        mark_dirty(board)
+        self.draw_cells(self.screen)
+
+    def set_cages(self, cages) -> None:
+        """
+        Show the cages of a killer sudoku: the sum of each cage in its first cell and
+        a thin border inside the cells along the edges of the cage.
+        :param cages: `solver.Cages` of the puzzle, None to remove the cages.
+        """
+        self.cages = cages
+        # Index of the cage of each caged cell, and the sums by the first cell of each cage
+        cell_cages = {}
+        sums = {}
+        for n, (cells, total) in enumerate(cages.cages if cages is not None else []):
+            for k in cells:
+                cell_cages[divmod(k, self.size)] = n
+            sums[divmod(min(cells), self.size)] = total
+        for i in range(self.size):
+            for j in range(self.size):
+                cell = self.cells[i][j]
+                cage = cell_cages.get((i, j))
+                cell.cage_sum = sums.get((i, j))
+                cell.cage_sides = [] if cage is None else [
+                    side for side, neighbour in (("top", (i - 1, j)), ("bottom", (i + 1, j)),
+                                                 ("left", (i, j - 1)), ("right", (i, j + 1)))
+                    if cell_cages.get(neighbour) != cage]
+                cell.draw_cell(self.screen)
+
     def draw_lines(self, screen) -> None:
         """
-        Draw 10 horizontal and 10 vertical lines on the pygame `screen`.
-        Every third line is wider.
+        Draw the horizontal and vertical lines between the cells on the pygame `screen`.
+        The lines around the squares are wider.
         :param screen: Pygame display window
         :return: None
         """
         # Draw horizontal and vertical lines
-        cell_size = self.width // 9
-        for i in range(10):
+        cell_size = self.cell_size
+        end = self.size * cell_size
+        for i in range(self.size + 1):
             width = 1
-            # Every third line is wider
-            if i % 3 == 0:
+            # The lines around the squares are wider
+            if i % self.box == 0:
                 width = 5
             # Calculate start and end positions for the line
             start_pos_horizontal = (0, i * cell_size)
-            end_pos_horizontal = (self.width, i * cell_size)
+            end_pos_horizontal = (end, i * cell_size)
             start_pos_vertical = (i * cell_size, 0)
-            end_pos_vertical = (i * cell_size, self.height)
+            end_pos_vertical = (i * cell_size, end)
             # Draw the i:th horizontal and vertical line
             pygame.draw.line(screen, settings.BLACK, start_pos_horizontal, end_pos_horizontal, width)
             pygame.draw.line(screen, settings.BLACK, start_pos_vertical, end_pos_vertical, width)
@@ -95,8 +211,8 @@ class Board:
         :param screen: Pygame display window
         :return: None
         """
-        for i in range(9):
-            for j in range(9):
+        for i in range(self.size):
+            for j in range(self.size):
                 self.cells[i][j].draw_cell(screen)
 
     def select_cell(self, row: int, col: int, screen) -> None:
@@ -110,33 +226,32 @@ class Board:
         :param screen: Pygame display window
         :return: None
         """
-        # Reset every cell
-        for i in range(9):
-            for j in range(9):
-                self.cells[i][j].is_selected = False
-
-        # Row and column numbers are between 0 and 8. If the number is bigger
-        # reduce it back to the range by taking modulo 9.
-        row %= 9
-        col %= 9
+        # Reset the previously selected cell
+        previous = self.cells[self.selected_cell[0]][self.selected_cell[1]]
+        previous.is_selected = False
+        previous.draw_cell(screen)
+
+        # Row and column numbers are between 0 and size - 1. If the number is bigger
+        # reduce it back to the range by taking modulo size.
+        row %= self.size
+        col %= self.size
         # Select new cell
         self.cells[row][col].is_selected = True
         self.selected_cell = (row, col)
-
-        # Draw the cells to update the screen.
-        self.draw_cells(screen)
+        self.cells[row][col].draw_cell(screen)
 
     def change_value(self, value: int) -> None:
         row = self.selected_cell[0]
         col = self.selected_cell[1]
+        if value > self.size:
+            return
         if not self.cells[row][col].has_initial_value:
             possible = True
             errors = []
-            if value != 10:
+            if value:
                 possible, errors = is_possible(self.current_puzzle, value, row, col)
             if possible:
-                # If value 10 is provided, use the cell's value property to change
-                # the value to zero (clear the cell).
+                # Value 0 clears the cell
                 self.cells[row][col].value = value
                 self.update_value(value, row, col)
             else:
@@ -151,8 +266,8 @@ class Board:
         :return: None
         """
         self.current_puzzle = self.puzzle
-        for i in range(9):
-            for j in range(9):
+        for i in range(self.size):
+            for j in range(self.size):
                 if not self.cells[i][j].has_initial_value:
                     self.cells[i][j].value = 0
                 elif clear_initials:
@@ -160,21 +275,77 @@ class Board:
                     self.cells[i][j].has_initial_value = False
 
     def clear_bg_colors(self):
-        for i in range(9):
-            for j in range(9):
-                self.cells[i][j].show_error = False
-                self.cells[i][j].unique_value = None
-                self.cells[i][j].backtracking_correct = False
-                self.cells[i][j].backtracking_incorrect = False
+        for i in range(self.size):
+            for j in range(self.size):
+                cell = self.cells[i][j]
+                if cell.show_error or cell.unique_value or cell.backtracking_correct or cell.backtracking_incorrect:
+                    cell.show_error = False
+                    cell.unique_value = None
+                    cell.backtracking_correct = False
+                    cell.backtracking_incorrect = False
+                    cell.draw_cell(self.screen)
 
     def update_value(self, value, row, col) -> None:
-        if 0 < value < 10:
-            self.current_puzzle[row][col] = value
-            if check_solution(self.current_puzzle):
-                self.update_board(self.screen)
-                show_end_screen("Congratulations! You solved the sudoku")
-        elif value == 10:
-            self.current_puzzle[row][col] = 0
+        self.current_puzzle[row][col] = value
+        # A filled killer sudoku has exactly one solution if its cages add up
+        if value and check_solution(self.current_puzzle) and (
+                self.cages is None or count_solutions(self.current_puzzle, 1, cages=self.cages)):
+            self.update_board(self.screen)
+            show_end_screen("Congratulations! You solved the sudoku")
+
+    def solve_puzzle(self):
+        """
+        Start solving the puzzle in the background. The main loop shows the solution
+        from `update_solve` when it is ready.
+        """
+        if not self.solver.running:
+            self.solver.start(self.puzzle, self.puzzle_id, cages=self.cages)
+
+    def update_solve(self):
+        """
+        Check the background solve once per frame, drawing a spinner while it runs.
+        """
+        if not self.solver.running:
+            return
+        result = self.solver.poll()
+        if result is None:
+            if not self.solver.cancelled:
+                self.draw_spinner(self.screen)
+            return
+        # Erase the spinner
+        center = self.size // 2
+        self.cells[center][center].draw_cell(self.screen)
+        self.update_board(self.screen)
+        status, solution = result
+        if status == "done":
+            if self.solver.replay is not None:
+                self.start_replay(self.solver.replay)
+            else:
+                self.show_solution(solution)
+
+    def discard_solve(self) -> None:
+        """
+        Cancel the running solve and stop the replay before the board is replaced,
+        so that their results are not shown on another puzzle.
+        """
+        if self.solver.running and not self.solver.cancelled:
+            self.solver.cancel()
+            # Erase the spinner
+            center = self.size // 2
+            self.cells[center][center].draw_cell(self.screen)
+        if self.replay is not None:
+            self.stop_replay()
+
+    def draw_spinner(self, screen) -> None:
+        """
+        Draw a rotating arc over the center cell.
+        """
+        center = self.size // 2
+        cell = self.cells[center][center]
+        cell.draw_cell(screen)
+        rect = pygame.Rect(center * cell.cell_width, center * cell.cell_height, cell.cell_width, cell.cell_height)
+        angle = pygame.time.get_ticks() / 150
+        pygame.draw.arc(screen, settings.DARK_BLUE, rect.inflate(-16, -16), angle, angle + 4.5, 4)
 
     def show_solution(self, solution):
         if solution is None:
@@ -184,49 +355,75 @@ class Board:
         show_end_screen("Sudoku solved by non-visual backtracking")
 
     def update_board(self, screen):
-        # self.draw_cells(screen)
-        self.draw_lines(screen)
-        # draw_game_info(screen)
-        pygame.display.update()
-
-    def solve_unique_values(self, func, possible_values, color):
-        value_found = True
-        continue_loop, cell = func(possible_values, self.current_puzzle)
-        if continue_loop:
-            self.cells[cell[0]][cell[1]].unique_value = color.copy()
-            self.cells[cell[0]][cell[1]].value = self.current_puzzle[cell[0]][cell[1]]
-            color[2] -= 3
-            color[0] += 2
-        else:
-            value_found = False
-        self.update_board(self.screen)
-        return value_found
+        """
+        Update the parts of the display which have been drawn since the last update.
+        Nothing is drawn while the board does not change.
+        """
+        if _dirty_rects:
+            # Redrawn cells cover the edges of the lines
+            self.draw_lines(screen)
+            flush_display()
 
     def solve_visually(self):
-        run = True
-        color = list(settings.DARK_BLUE)
-
-        while run:
-            possible_values = [[solver_visual.get_possible_values(self.current_puzzle, i, j) for j in range(9)]
-                               for i in range(9)]
-
-            if self.solve_unique_values(solver_visual.fill_unique, possible_values, color):
-                continue
-            if self.solve_unique_values(solver_visual.fill_square, possible_values, color):
-                continue
-            if self.solve_unique_values(solver_visual.fill_row, possible_values, color):
-                continue
-            if self.solve_unique_values(solver_visual.fill_col, possible_values, color):
-                continue
-
-            if not check_solution(self.current_puzzle):
-                solver_visual.backtracking(self, self.screen)
-                self.clear_bg_colors()
-                self.draw_cells(self.screen)
-                self.update_board(self.screen)
-
-            run = False
+        """
+        Solve the puzzle in the background while recording the steps of the solver.
+        The main loop replays them from `update_replay` when the solve is done.
+        """
+        if not self.solver.running and self.replay is None:
+            self.clear_bg_colors()
+            self.solver.start(self.current_puzzle, trace=True, cages=self.cages)
 
+    def start_replay(self, replay):
+        self.replay = replay
+        self.replay_position = 0.0
+        self.replay_paused = False
+
+    def update_replay(self, elapsed_ms):
+        """
+        Advance the replay by the steps of one frame at the replay speed. Only the state
+        at the end of the frame is drawn, so any number of steps can be skipped per frame.
+        :param elapsed_ms: Milliseconds since the previous frame.
+        """
+        if self.replay is None:
+            return
+        if not self.replay_paused:
+            self.replay_position = min(self.replay_position + self.replay_speed * elapsed_ms / 1000, len(self.replay))
+        self.show_replay_step()
+        if self.replay.finished and not self.replay_paused:
+            self.end_replay()
+
+    def seek_replay(self, steps, relative=True):
+        """
+        Move the replay by `steps`, or to step `steps` if `relative` is False.
+        """
+        if self.replay is None:
+            return
+        position = self.replay_position + steps if relative else steps
+        self.replay_position = float(max(0, min(int(position), len(self.replay))))
+        self.show_replay_step()
+
+    def show_replay_step(self):
+        for k in self.replay.seek(int(self.replay_position)):
+            value, kind = self.replay.cell(k)
+            cell = self.cells[k // self.size][k % self.size]
+            cell.backtracking_correct = kind == solver.TRACE_GUESS
+            cell.backtracking_incorrect = kind == solver.TRACE_UNDO
+            cell.unique_value = TECHNIQUE_COLORS.get(kind)
+            # The value setter draws the cell
+            cell.value = value
+        state = "paused" if self.replay_paused else f"{self.replay_speed} steps/s"
+        pygame.display.set_caption(f"Sudoku Solver - step {self.replay.position}/{len(self.replay)} ({state})")
+
+    def stop_replay(self):
+        self.replay = None
+        pygame.display.set_caption("Sudoku Solver")
+        self.clear_bg_colors()
+
+    def end_replay(self):
+        grid = self.replay.grid
+        self.stop_replay()
+        self.current_puzzle = [list(grid[self.size * i:self.size * i + self.size]) for i in range(self.size)]
+        self.update_board(self.screen)
         if check_solution(self.current_puzzle):
             show_end_screen("Sudoku solved by visual backtracking")
         else:
@@ -235,13 +432,15 @@ class Board:
 
 
 class Cell:
-    def __init__(self, value, row, col, width, height, screen):
+    def __init__(self, value, row, col, width, height, screen, size=9):
         self.screen = screen
         self._value = value
         self.row = row
         self.col = col
-        self.cell_width = width // 9
-        self.cell_height = height // 9
+        # Number of rows and columns of the board
+        self.size = size
+        self.cell_width = width // size
+        self.cell_height = height // size
         self.has_initial_value = True if self.value else False
 
         # Attributes affecting to background color
@@ -251,18 +450,21 @@ class Cell:
         self.backtracking_correct = False
         self.backtracking_incorrect = False
 
+        # Sum of the killer cage starting at this cell, and the sides of the cell on the edge of its cage
+        self.cage_sum = None
+        self.cage_sides = []
+
     @property
     def value(self):
         return self._value
 
     @value.setter
     def value(self, x):
-        if 0 < x < 10:
+        if 0 < x <= self.size:
             self._value = x
         else:
             self._value = 0
         self.draw_cell(self.screen)
-        pygame.display.update()
 
     def draw_cell(self, screen) -> None:
         """
@@ -283,9 +485,32 @@ class Cell:
         # Create solid coloured Pygame Rect object and draw it into correct position
         cell = pygame.Rect(self.col * self.cell_width, self.row * self.cell_height, self.cell_width, self.cell_height)
         pygame.draw.rect(screen, color, cell)
+        if self.cage_sides:
+            self.draw_cage(screen, cell)
         # If the cell has a value, draw it on top of the coloured cell
         if self.value:
             self.draw_value(screen)
+        mark_dirty(cell)
+
+    def draw_cage(self, screen, cell) -> None:
+        """
+        Draw the edges of the killer cage inside the cell, and the sum of the cage in its first cell.
+        :param cell: Pygame Rect of the cell
+        """
+        inner = cell.inflate(-2 * settings.CAGE_MARGIN, -2 * settings.CAGE_MARGIN)
+        for side in self.cage_sides:
+            if side == "top":
+                start, end = inner.topleft, inner.topright
+            elif side == "bottom":
+                start, end = inner.bottomleft, inner.bottomright
+            elif side == "left":
+                start, end = inner.topleft, inner.bottomleft
+            else:
+                start, end = inner.topright, inner.bottomright
+            pygame.draw.line(screen, settings.GREY, start, end, 1)
+        if self.cage_sum is not None:
+            text = render_text(str(self.cage_sum), settings.FONT_SIZE_CAGE, settings.BLACK)
+            screen.blit(text, (inner.x + 2, inner.y + 1))
 
     def draw_value(self, screen) -> None:
         """
@@ -296,11 +521,9 @@ class Cell:
 
         # Choose black color for initial values and grey for others
         color = settings.BLACK if self.has_initial_value else settings.GREY
-        # Choose larger font for initial values
+        # Choose larger font for initial values, the font sizes are for a 9x9 board
         size = settings.FONT_SIZE_LARGE if self.has_initial_value else settings.FONT_SIZE_NORMAL
-        # Create the font object to draw
-        font = pygame.font.SysFont("comicsans", size)
-        text = font.render(str(self.value), True, color)
+        text = render_text(puzzle_io.SYMBOLS[self.value - 1], size * 9 // self.size, color)
         # Calculate the placement for the text
         width_adjustment = (self.cell_width - text.get_width()) // 2
         height_adjustment = (self.cell_height - text.get_height()) // 2
@@ -318,8 +541,7 @@ class Button:
         self.bottom_color = settings.btn_bottom_color
         # Text
         self.text = text
-        self.text_font = pygame.font.SysFont("comicsans", 20)
-        self.text_render = self.text_font.render(str(self.text), True, settings.BLACK)
+        self.text_render = render_text(str(self.text), 20, settings.BLACK)
         self.text_rect = self.text_render.get_rect()
         # Location
         self.pos_x, self.pos_y = pos
@@ -342,12 +564,13 @@ class Button:
         pygame.draw.rect(self.screen, self.bottom_color, self.bottom_part, border_radius=15)
         pygame.draw.rect(self.screen, self.top_color, self.top_part, border_radius=15)
         self.screen.blit(self.text_render, self.text_rect)
+        mark_dirty(self.top_part.union(self.bottom_part))
 
     def check_click(self):
         self.top_color = settings.btn_bottom_color
         self.bottom_color = settings.BLACK
         self.draw_button()
-        pygame.display.update()
+        flush_display()
 
     def reset_click(self):
         self.top_color = settings.btn_top_color
@@ -369,8 +592,8 @@ def handle_mouse_click(board, screen, buttons) -> None:
     # Check if the click is inside the board
     if y < settings.height:
         # Calculate which row and column contain the clicked cell
-        row = y // settings.cell_size
-        col = x // settings.cell_size
+        row = y // board.cell_size
+        col = x // board.cell_size
         # Select new cell
         board.select_cell(row, col, screen)
     elif settings.height <= y <= settings.w_height:
@@ -392,6 +615,8 @@ def handle_mouse_click(board, screen, buttons) -> None:
             if puzzle_id is not None:
                 new_puzzle = puzzles_db.load_puzzle(puzzle_id)
                 board.load_puzzle(puzzle=new_puzzle, clear_initials=True)
+                board.set_cages(puzzles_db.load_cages(puzzle_id))
+                board.puzzle_id = puzzle_id
         elif close.top_part.collidepoint(x, y):
             exit()
         for button in buttons:
@@ -440,7 +665,10 @@ def handle_number_keys(event, board) -> None:
     if event.key == pygame.K_9:
         board.change_value(9)
     if event.key == pygame.K_0 or event.key == pygame.K_BACKSPACE:
-        board.change_value(10)
+        board.change_value(0)
+    # The values above 9 are typed as capital letters, A for 10
+    if event.unicode and event.unicode in puzzle_io.SYMBOLS[9:]:
+        board.change_value(puzzle_io.SYMBOLS.index(event.unicode) + 1)
 
 
 def draw_buttons(buttons) -> None:
@@ -476,9 +704,21 @@ def locate_puzzle_list(window):
     # window.geometry("%dx%d+%d+%d" % (settings.p_width, settings.p_height, window_x, window_y))
 
 
+def change_size(board) -> None:
+    """
+    Replace the board with an empty board of the next size in `settings.board_sizes`.
+    """
+    sizes = settings.board_sizes
+    board.set_size(sizes[(sizes.index(board.size) + 1) % len(sizes)] if board.size in sizes else sizes[0])
+    board.puzzle_id = None
+
+
 def setup_puzzle(board) -> None:
-    board.puzzle = [[0 for _ in range(9)] for _ in range(9)]
+    board.discard_solve()
+    board.puzzle = [[0 for _ in range(board.size)] for _ in range(board.size)]
+    board.puzzle_id = None
     board.clear_cells(clear_initials=True)
+    board.set_cages(None)
 
 
 def save_puzzle(board) -> None:
@@ -515,9 +755,18 @@ def save_puzzle(board) -> None:
     window.mainloop()
 
     if saving:
+        # Reject puzzles without a solution and ask before saving ones with several
+        solutions = count_solutions(board.current_puzzle, cages=board.cages)
+        if solutions == 0:
+            messagebox.showwarning(title="Warning!", message="Sudoku is impossible to solve")
+            return
+        if solutions > 1 and not messagebox.askyesno(title="Warning!",
+                                                     message="Sudoku has more than one solution. Save anyway?"):
+            return
         if puzzles_db.check_name(name):
-            puzzles_db.add_puzzle(name, board.current_puzzle)
+            puzzle_id = puzzles_db.add_puzzle(name, board.current_puzzle, solutions, board.cages)
             board.load_puzzle(puzzle=board.current_puzzle)
+            board.puzzle_id = puzzle_id
         else:
             messagebox.showwarning("Name is already taken")
 
@@ -555,8 +804,24 @@ def open_settings() -> None:
 def open_puzzles_db():
     def on_select(event):
         nonlocal _selected_puzzle
-        if listbox.curselection()[0] >= 0:
-            _selected_puzzle = listbox.curselection()[0] + 1
+        if listbox.curselection():
+            _selected_puzzle = ids[listbox.curselection()[0]]
+
+    def on_scroll(first, last):
+        # Fetch the next page when the end of the list comes into view
+        scrollbar.set(first, last)
+        if float(last) > 0.9:
+            load_page()
+
+    def load_page():
+        nonlocal has_more
+        if not has_more:
+            return
+        page = puzzles_db.list_puzzles(after_id=ids[-1] if ids else 0)
+        has_more = len(page) == puzzles_db.PAGE_SIZE
+        for puzzle_id, name in page:
+            ids.append(puzzle_id)
+            listbox.insert(tk.END, name)
 
     def load():
         nonlocal _selected_puzzle, window, return_value
@@ -568,6 +833,9 @@ def open_puzzles_db():
 
     return_value = None
     _selected_puzzle = None
+    # Ids of the puzzles in the listbox, which is filled one page at a time
+    ids = []
+    has_more = True
     window = tk.Tk()
     window.title("Settings")
     window.geometry("%dx%d+%d+%d" % locate_puzzle_list(window))
@@ -588,15 +856,14 @@ def open_puzzles_db():
 
     scrollbar = tk.Scrollbar(window, orient=tk.VERTICAL, command=listbox.yview)
     scrollbar.grid(row=1, column=0, sticky="nse", padx=(0, 30))
-    listbox["yscrollcommand"] = scrollbar.set
+    listbox["yscrollcommand"] = on_scroll
     listbox.bind("<<ListboxSelect>>", on_select)
 
     load_btn = tk.Button(window, text="Load", command=load)
     load_btn.grid(row=2)
     load_btn.config(border=2)
 
-    for puzzle in puzzles_db.load_puzzles():
-        listbox.insert(tk.END, puzzle[0])
+    load_page()
 
     window.mainloop()
     return return_value if return_value else None
@@ -614,10 +881,46 @@ def show_end_screen(text) -> None:
     window.mainloop()
 
 
+def handle_replay_keys(event, board) -> None:
+    """
+    Control a running replay: Space pauses, the up and down arrows double and halve
+    the speed, the left and right arrows step once and Page Up and Page Down skip a
+    tenth of the steps. Esc stops the replay.
+    """
+    if event.key == pygame.K_SPACE:
+        board.replay_paused = not board.replay_paused
+        board.show_replay_step()
+    if event.key == pygame.K_UP:
+        board.replay_speed = min(board.replay_speed * 2, settings.REPLAY_MAX_SPEED)
+    if event.key == pygame.K_DOWN:
+        board.replay_speed = max(board.replay_speed // 2, 1)
+    if event.key in (pygame.K_LEFT, pygame.K_RIGHT):
+        board.replay_paused = True
+        board.seek_replay(-1 if event.key == pygame.K_LEFT else 1)
+    if event.key in (pygame.K_PAGEUP, pygame.K_PAGEDOWN):
+        tenth = max(len(board.replay) // 10, 1)
+        board.seek_replay(-tenth if event.key == pygame.K_PAGEUP else tenth)
+    if event.key == pygame.K_HOME:
+        board.seek_replay(0, relative=False)
+    if event.key == pygame.K_END:
+        board.seek_replay(len(board.replay), relative=False)
+    if event.key == pygame.K_ESCAPE:
+        board.stop_replay()
+        board.clear_cells()
+
+
 def check_events(board, screen, buttons) -> bool:
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
+            board.solver.cancel()
             return False
+        if event.type == pygame.VIDEOEXPOSE:
+            # The window was uncovered, for example by closing a Tkinter window
+            mark_dirty(screen.get_rect())
+        if board.replay is not None:
+            if event.type == pygame.KEYDOWN:
+                handle_replay_keys(event, board)
+            continue
         if event.type == pygame.MOUSEBUTTONDOWN:
             board.clear_bg_colors()
             if event.button == 1:
@@ -627,17 +930,24 @@ def check_events(board, screen, buttons) -> bool:
             handle_arrow_keys(event, board, screen)
             handle_number_keys(event, board)
             if event.key == pygame.K_SPACE:
-                board.show_solution(solve(board.puzzle))
+                board.solve_puzzle()
             if event.key == pygame.K_v:
                 board.solve_visually()
             if event.key == pygame.K_DELETE:
                 board.clear_cells()
-            if event.key == pygame.K_c:
+            # With Shift the letters are values of the larger boards
+            shift = event.mod & pygame.KMOD_SHIFT
+            if event.key == pygame.K_c and not shift:
                 show_controls()
-            if event.key == pygame.K_s:
+            if event.key == pygame.K_s and not shift:
                 open_settings()
+            if event.key == pygame.K_n and not shift:
+                change_size(board)
             if event.key == pygame.K_ESCAPE:
-                return False
+                # Esc cancels a running solve and closes the game otherwise
+                if not board.solver.running:
+                    return False
+                board.solver.cancel()
     return True
 
 
@@ -648,6 +958,7 @@ def run_game():
     pygame.display.set_caption("Sudoku Solver")
 
     screen.fill(settings.WHITE)
+    mark_dirty(screen.get_rect())
     clock = pygame.time.Clock()
     run = True
 
@@ -666,8 +977,10 @@ def run_game():
 
     # main loop
     while run:
-        clock.tick(settings.FPS)
+        elapsed_ms = clock.tick(settings.FPS)
         run = check_events(board, screen, buttons)
+        board.update_solve()
+        board.update_replay(elapsed_ms)
         board.update_board(screen)
 
 
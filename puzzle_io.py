@@ -0,0 +1,220 @@
+import gzip
+import itertools
+import math
+import sys
+
+# Puzzle file formats:
+#   line   - one puzzle per line as 81 characters, "." or "0" for empty cells. The
+#            4x4, 16x16 and 25x25 boards have 16, 256 or 625 characters, with the
+#            values above 9 written as letters from A
+#   sdk    - nine lines of nine cells per puzzle, puzzles separated by blank lines
+#   binary - 41 bytes per puzzle, two cells per byte with the first cell in the high 4 bits
+# The sdk and binary formats only hold 9x9 puzzles.
+# Any of them can be gzip compressed, which is detected from a ".gz" file name suffix.
+FORMATS = ("line", "sdk", "binary")
+FORMAT_SUFFIXES = {".txt": "line", ".sdk": "sdk", ".bin": "binary"}
+PACKED_SIZE = 41
+# Characters of the values 1-25 in the line format
+SYMBOLS = "123456789ABCDEFGHIJKLMNOP"
+# Sizes of the boards other than 9x9 which can be read and packed
+OTHER_SIZES = (4, 16, 25)
+
+# Characters accepted for an empty cell in the text formats
+EMPTY_CHARS = ".0"
+# Characters ignored in the sdk format, used to draw the borders of the squares
+SDK_SEPARATORS = " \t|-+"
+
+# Translation of the text formats to cell values. Characters which are not a cell
+# are mapped to 255 so that one max() call validates a whole puzzle.
+_CELL_TABLE = bytes(0 if c in EMPTY_CHARS else int(c) if "1" <= c <= "9" else 255 for c in map(chr, range(256)))
+_SYMBOL_TABLE = bytes(0 if c in EMPTY_CHARS else SYMBOLS.index(c.upper()) + 1 if c.upper() in SYMBOLS
+                      else 255 for c in map(chr, range(256)))
+_SDK_DELETE = (SDK_SEPARATORS + "\r\n").encode()
+# Pairs of cell values packed in one byte
+_UNPACKED = [(byte >> 4, byte & 15) for byte in range(256)]
+# Translation of a cell value to the high 4 bits of a byte
+_HIGH_NIBBLE = bytes((value << 4) & 255 for value in range(256))
+# Number of puzzles read from a binary file at a time
+_BINARY_BLOCK = 4096
+
+
+def parse_line(line):
+    """
+    Parse a puzzle in the 81-character line format, where the cells are listed
+    row by row and an empty cell is written as "." or "0". A line of 16, 256 or 625
+    characters is a board of another size, with the values above 9 as letters.
+    :param line: Line of text as str or bytes, surrounding whitespace is ignored.
+    :return: List containing the lists of values of the each row, 0 for empty cells.
+    """
+    if isinstance(line, str):
+        line = line.encode("ascii", "replace")
+    line = line.strip()
+    values = line.translate(_CELL_TABLE)
+    if len(values) == 81 and max(values) <= 9:
+        return [list(values[9 * i:9 * i + 9]) for i in range(9)]
+    size = math.isqrt(len(values))
+    if size in OTHER_SIZES and size * size == len(values):
+        values = line.translate(_SYMBOL_TABLE)
+        if max(values) <= size:
+            return [list(values[size * i:size * i + size]) for i in range(size)]
+    raise ValueError(f"Invalid puzzle line: {line!r}")
+
+
+def format_line(puzzle, empty="."):
+    """
+    Format a puzzle as a line of one character per cell, writing the empty cells as `empty`.
+    """
+    return "".join(SYMBOLS[value - 1] if value else empty for row in puzzle for value in row)
+
+
+def pack(puzzle) -> bytes:
+    """
+    Pack a puzzle into 41 bytes, two cells per byte. The values of the other board
+    sizes do not fit in 4 bits, they are packed one cell per byte.
+    """
+    if len(puzzle) != 9:
+        return bytes(itertools.chain.from_iterable(puzzle))
+    values = bytes(itertools.chain.from_iterable(puzzle)) + b"\0"
+    # The high and low halves of every byte are combined as two big integers
+    high = int.from_bytes(values[0::2].translate(_HIGH_NIBBLE), "big")
+    return (high | int.from_bytes(values[1::2], "big")).to_bytes(PACKED_SIZE, "big")
+
+
+def unpack(data):
+    """
+    Unpack a puzzle packed with `pack`. The size of the board is told by the length of `data`.
+    """
+    if len(data) != PACKED_SIZE:
+        size = math.isqrt(len(data))
+        if size not in OTHER_SIZES or size * size != len(data) or max(data) > size:
+            raise ValueError(f"Invalid packed puzzle of {len(data)} bytes")
+        return [list(data[size * i:size * i + size]) for i in range(size)]
+    values = list(itertools.chain.from_iterable(map(_UNPACKED.__getitem__, data)))
+    if max(values) > 9:
+        raise ValueError(f"Invalid packed puzzle: {bytes(data)!r}")
+    return [values[9 * i:9 * i + 9] for i in range(9)]
+
+
+def detect_format(path) -> str:
+    """
+    Detect the puzzle format from the file name, ignoring a ".gz" suffix.
+    Unknown suffixes are read as the line format.
+    """
+    name = path[:-3] if path.endswith(".gz") else path
+    for suffix, fmt in FORMAT_SUFFIXES.items():
+        if name.endswith(suffix):
+            return fmt
+    return "line"
+
+
+def open_file(path, mode="rb"):
+    """
+    Open a puzzle file in binary mode. "-" is the standard input or output, and
+    files ending with ".gz" are compressed and decompressed on the fly.
+    """
+    if path == "-":
+        return sys.stdin.buffer if "r" in mode else sys.stdout.buffer
+    if path.endswith(".gz"):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+def read_lines(file):
+    """
+    Read puzzles from a binary file in the line format one at a time.
+    Blank lines and lines starting with "#" are skipped.
+    """
+    for line in file:
+        line = line.strip()
+        if line and not line.startswith(b"#"):
+            yield parse_line(line)
+
+
+def read_sdk(file):
+    """
+    Read puzzles from a binary file in the sdk format one at a time. The cells of
+    a puzzle may be spread over any number of lines, borders drawn with " |-+" are
+    ignored, and lines starting with "#" or "[" are skipped.
+    """
+    cells = b""
+    for line in file:
+        line = line.strip()
+        if line.startswith(b"#") or line.startswith(b"["):
+            continue
+        cells += line.translate(None, _SDK_DELETE)
+        if len(cells) >= 81:
+            yield parse_line(cells[:81])
+            cells = cells[81:]
+    if cells:
+        raise ValueError(f"Incomplete puzzle at the end of the file: {cells!r}")
+
+
+def read_binary(file):
+    """
+    Read puzzles from a binary file in the packed format one at a time.
+    """
+    while True:
+        block = file.read(PACKED_SIZE * _BINARY_BLOCK)
+        if not block:
+            return
+        if len(block) % PACKED_SIZE:
+            raise ValueError("Binary puzzle file is truncated")
+        for start in range(0, len(block), PACKED_SIZE):
+            yield unpack(block[start:start + PACKED_SIZE])
+
+
+def write_line(file, puzzle) -> None:
+    file.write(format_line(puzzle).encode() + b"\n")
+
+
+def write_sdk(file, puzzle) -> None:
+    file.write(b"".join(format_line([row]).encode() + b"\n" for row in puzzle) + b"\n")
+
+
+def write_binary(file, puzzle) -> None:
+    if len(puzzle) != 9:
+        raise ValueError("The binary format only holds 9x9 puzzles")
+    file.write(pack(puzzle))
+
+
+READERS = {"line": read_lines, "sdk": read_sdk, "binary": read_binary}
+WRITERS = {"line": write_line, "sdk": write_sdk, "binary": write_binary}
+
+
+def read_puzzles(path, fmt=None):
+    """
+    Stream the puzzles of a file one at a time. Only one block of the file is held
+    in memory, so the size of the file does not matter.
+    :param path: File name, or "-" for the standard input.
+    :param fmt: One of `FORMATS`, detected from the file name if not given.
+    :return: Generator of puzzles as lists containing the lists of values of the each row.
+    """
+    reader = READERS[fmt or detect_format(path)]
+    file = open_file(path, "rb")
+    try:
+        yield from reader(file)
+    finally:
+        if path != "-":
+            file.close()
+
+
+def write_puzzles(path, puzzles, fmt=None) -> int:
+    """
+    Write the puzzles of an iterable to a file as they are produced.
+    :param path: File name, or "-" for the standard output.
+    :param fmt: One of `FORMATS`, detected from the file name if not given.
+    :return: Number of puzzles written.
+    """
+    writer = WRITERS[fmt or detect_format(path)]
+    file = open_file(path, "wb")
+    count = 0
+    try:
+        for puzzle in puzzles:
+            writer(file, puzzle)
+            count += 1
+    finally:
+        if path == "-":
+            file.flush()
+        else:
+            file.close()
+    return count
@@ -2,57 +2,408 @@ import sqlite3
 import json
 import settings
 import datetime
+import os
 import pytz
 
+import puzzle_io
+from solver import Cages, solve, count_solutions
 
-db_conn = sqlite3.connect("puzzles_db.sqlite", detect_types=sqlite3.PARSE_DECLTYPES)
 
+DB_PATH = "puzzles_db.sqlite"
 
-def initialize_db():
-    db_conn.execute("CREATE TABLE IF NOT EXISTS puzzles (_id INTEGER PRIMARY KEY, name TEXT NOT NULL,"
-                    " puzzle TEXT NOT NULL, time TIMESTAMP NOT NULL)")
-    preset_puzzles = {"easy": json.dumps(settings.puzzle_easy),
-                      "normal": json.dumps(settings.puzzle_normal),
-                      "hard": json.dumps(settings.puzzle_hard),
-                      "very hard": json.dumps(settings.puzzle_very_hard),
-                      "empty": json.dumps(settings.puzzle_empty),
-                      "impossible": json.dumps(settings.puzzle_impossible),
-                      "anti backtracking": json.dumps(settings.puzzle_anti_backtracking),
-                      }
+
+def connect(path=DB_PATH):
+    """
+    Open a connection to the puzzle database in WAL mode, so that the command line
+    tools can write while the game reads.
+    """
+    conn = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+# Connection of the game, opened by `get_conn` on first use so that importing this
+# module does not create a database in the working directory
+_db_conn = None
+
+
+def get_conn():
+    """
+    :return: The connection to the database at `DB_PATH`, used when no connection is passed.
+    """
+    global _db_conn
+    if _db_conn is None:
+        _db_conn = connect()
+    return _db_conn
+
+
+# Options of the solves whose results are stored in the database
+SOLVE_OPTIONS = {"strategy": "mrv"}
+# Number of puzzles solved between two commits of the backfill
+BACKFILL_BATCH = 100
+# Number of puzzles inserted per transaction by `import_puzzles`
+IMPORT_BATCH = 10000
+# Number of puzzles returned by `list_puzzles` at a time
+PAGE_SIZE = 200
+
+
+def _add_solution_columns(conn):
+    """
+    Schema version 1: store the solution, the number of givens, the solve status
+    ("solved" or "unsolvable", NULL if not solved yet) and the measured solve cost.
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(puzzles)")}
+    for name, definition in (("solution", "TEXT"), ("givens", "INTEGER"), ("status", "TEXT"),
+                             ("solve_seconds", "REAL"), ("solve_nodes", "INTEGER")):
+        if name not in columns:
+            conn.execute(f"ALTER TABLE puzzles ADD COLUMN {name} {definition}")
+    rows = conn.execute("SELECT _id, puzzle FROM puzzles WHERE givens IS NULL").fetchall()
+    conn.executemany("UPDATE puzzles SET givens = ? WHERE _id = ?",
+                     ((count_givens(json.loads(puzzle)), id) for id, puzzle in rows))
+
+
+def _pack_puzzles(conn):
+    """
+    Schema version 2: store the puzzles and solutions packed with `puzzle_io.pack`
+    in 41 bytes instead of JSON, and make the names unique. The first row with a name
+    keeps it, the later ones get " #<id>" appended, or the next free number if that
+    name is taken too.
+    """
+    conn.create_function("pack_json", 1, lambda text: None if text is None else puzzle_io.pack(json.loads(text)),
+                         deterministic=True)
+    conn.execute("CREATE TABLE puzzles_packed (_id INTEGER PRIMARY KEY, name TEXT NOT NULL,"
+                 " puzzle BLOB NOT NULL, time TIMESTAMP NOT NULL, solution BLOB, givens INTEGER, status TEXT,"
+                 " solve_seconds REAL, solve_nodes INTEGER)")
+    conn.execute("INSERT INTO puzzles_packed SELECT _id, name,"
+                 " pack_json(puzzle), time, pack_json(solution), givens, status, solve_seconds, solve_nodes"
+                 " FROM puzzles")
+    rows = conn.execute("SELECT _id, name FROM puzzles ORDER BY _id").fetchall()
+    taken = {name for _, name in rows}
+    kept = set()
+    renames = []
+    for id, name in rows:
+        if name not in kept:
+            kept.add(name)
+            continue
+        number = id
+        while f"{name} #{number}" in taken:
+            number += 1
+        taken.add(f"{name} #{number}")
+        renames.append((f"{name} #{number}", id))
+    conn.executemany("UPDATE puzzles_packed SET name = ? WHERE _id = ?", renames)
+    conn.execute("DROP TABLE puzzles")
+    conn.execute("ALTER TABLE puzzles_packed RENAME TO puzzles")
+    conn.execute("CREATE UNIQUE INDEX puzzles_name ON puzzles (name)")
+
+
+def _index_puzzles(conn):
+    """
+    Schema version 3: index the packed puzzles so that imports can skip puzzles
+    which are already stored.
+    """
+    conn.execute("CREATE INDEX puzzles_puzzle ON puzzles (puzzle)")
+
+
+def _add_solutions_column(conn):
+    """
+    Schema version 4: store the number of solutions found by `solver.count_solutions`,
+    1 for a unique puzzle and 2 for several solutions. NULL if not counted, which is
+    the case for imported puzzles.
+    """
+    conn.execute("ALTER TABLE puzzles ADD COLUMN solutions INTEGER")
+
+
+def _add_grade_columns(conn):
+    """
+    Schema version 5: store the grade from `grader.grade`, the score of the hardest
+    technique needed, its level and the techniques used as JSON.
+    """
+    for name, definition in (("difficulty", "INTEGER"), ("level", "TEXT"), ("techniques", "TEXT")):
+        conn.execute(f"ALTER TABLE puzzles ADD COLUMN {name} {definition}")
+
+
+def _add_cages_column(conn):
+    """
+    Schema version 6: store the cages of killer sudokus as JSON, the lists from
+    `solver.Cages.to_list`. NULL for classic puzzles.
+    """
+    conn.execute("ALTER TABLE puzzles ADD COLUMN cages TEXT")
+
+
+# Schema migrations in order. The index of the last applied migration + 1 is kept
+# in the database's user_version.
+MIGRATIONS = [_add_solution_columns, _pack_puzzles, _index_puzzles, _add_solutions_column, _add_grade_columns,
+              _add_cages_column]
+
+
+# Migrations which rewrite the whole table. The database is vacuumed after them to
+# give the space of the old rows back to the file system.
+_REWRITES = {_pack_puzzles}
+
+
+def migrate_db(conn=None):
+    """
+    Apply the migrations the database is missing. Each migration runs in one
+    transaction together with the update of user_version, so a failed migration
+    leaves the database as it was.
+    """
+    conn = conn or get_conn()
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    vacuum = False
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        # sqlite3 does not open transactions for schema changes by itself
+        conn.execute("BEGIN")
+        try:
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        vacuum = vacuum or migration in _REWRITES
+    if vacuum:
+        conn.execute("VACUUM")
+
+
+def initialize_db(conn=None):
+    conn = conn or get_conn()
+    conn.execute("CREATE TABLE IF NOT EXISTS puzzles (_id INTEGER PRIMARY KEY, name TEXT NOT NULL,"
+                 " puzzle TEXT NOT NULL, time TIMESTAMP NOT NULL)")
+    migrate_db(conn)
     current_time = pytz.utc.localize(datetime.datetime.utcnow())
-    insert_stmt = ("INSERT INTO puzzles (name, puzzle, time) SELECT ?, ?, ?"
-                   " WHERE NOT EXISTS (SELECT 1 FROM puzzles WHERE name = ?)")
+    insert_stmt = "INSERT OR IGNORE INTO puzzles (name, puzzle, time, givens, solutions) VALUES (?, ?, ?, ?, ?)"
+
+    for key, puzzle in settings.preset_puzzles.items():
+        if conn.execute("SELECT 1 FROM puzzles WHERE name = ?", (key,)).fetchone() is None:
+            conn.execute(insert_stmt, (key, puzzle_io.pack(puzzle), current_time, count_givens(puzzle),
+                                       count_solutions(puzzle)))
+    conn.commit()
 
-    for key, value in preset_puzzles.items():
-        db_conn.execute(insert_stmt, (key, value, current_time, key))
-    db_conn.commit()
 
+def count_givens(puzzle) -> int:
+    return sum(len(row) - row.count(0) for row in puzzle)
 
-def load_puzzle(id):
-    puzzle = db_conn.execute("SELECT puzzle FROM puzzles WHERE _id = ?", (id,))
-    return json.loads(puzzle.fetchone()[0])
 
+def load_puzzle(id, conn=None):
+    conn = conn or get_conn()
+    puzzle = conn.execute("SELECT puzzle FROM puzzles WHERE _id = ?", (id,))
+    return puzzle_io.unpack(puzzle.fetchone()[0])
 
-def load_puzzles():
-    puzzles = db_conn.execute("SELECT name FROM puzzles")
-    return puzzles
+
+def load_cages(id, conn=None):
+    """
+    :return: The `solver.Cages` of a killer sudoku, or None for a classic puzzle.
+    """
+    conn = conn or get_conn()
+    cages = conn.execute("SELECT cages FROM puzzles WHERE _id = ?", (id,)).fetchone()[0]
+    return _decode_cages(cages)
+
+
+def _decode_cages(text):
+    return Cages(json.loads(text)) if text is not None else None
+
+
+def list_puzzles(after_id=0, limit=PAGE_SIZE, conn=None):
+    """
+    Return one page of the puzzles in the order of their ids. The page is found
+    through the primary key, so any page is as cheap as the first one.
+    :param after_id: Id of the last puzzle of the previous page, 0 for the first page.
+    :return: List of (id, name) tuples, shorter than `limit` on the last page.
+    """
+    conn = conn or get_conn()
+    return conn.execute("SELECT _id, name FROM puzzles WHERE _id > ? ORDER BY _id LIMIT ?",
+                        (after_id, limit)).fetchall()
 
 
 def check_name(name):
     get_names = ("SELECT name FROM puzzles WHERE name = ?")
-    names = db_conn.execute(get_names, (name,)).fetchone()
+    names = get_conn().execute(get_names, (name,)).fetchone()
     return False if names else True
 
 
-def add_puzzle(name, puzzle):
-    insert_stmt = ("INSERT INTO puzzles (name, puzzle, time) SELECT ?, ?, ?"
-                   " WHERE NOT EXISTS (SELECT 1 FROM puzzles WHERE name = ?)")
+def add_puzzle(name, puzzle, solutions=None, cages=None):
+    """
+    Add a new puzzle unless the name is already taken.
+    :param solutions: Result of `solver.count_solutions` for the puzzle, counted here if not given.
+    :param cages: `solver.Cages`, or the (cells, total) pairs to build one, of a killer sudoku.
+    :return: Id of the new puzzle, or None if it was not added.
+    :raises ValueError: If the cages are not valid.
+    """
+    insert_stmt = ("INSERT OR IGNORE INTO puzzles (name, puzzle, time, givens, solutions, cages)"
+                   " VALUES (?, ?, ?, ?, ?, ?)")
+
+    if cages is not None and not isinstance(cages, Cages):
+        cages = Cages(cages)
+    if solutions is None:
+        solutions = count_solutions(puzzle, cages=cages)
+    current_time = pytz.utc.localize(datetime.datetime.utcnow())
+    value = puzzle_io.pack(puzzle)
+    conn = get_conn()
+    cursor = conn.execute(insert_stmt, (name, value, current_time, count_givens(puzzle), solutions,
+                                        json.dumps(cages.to_list()) if cages is not None else None))
+    conn.commit()
+    return cursor.lastrowid if cursor.rowcount else None
+
+
+def import_puzzles(path, fmt=None, name=None, batch_size=IMPORT_BATCH, conn=None) -> tuple:
+    """
+    Stream the puzzles of a file into the database with `add_puzzles`.
+    :param path: Puzzle file read with `puzzle_io.read_puzzles`.
+    :param fmt: One of `puzzle_io.FORMATS`, detected from the file name if not given.
+    :param name: Prefix of the names, the file name by default. The puzzles are
+        numbered as in `add_puzzles`.
+    :return: Tuple (read, added) of the number of puzzles read and added.
+    """
+    conn = conn or get_conn()
+    return add_puzzles(puzzle_io.read_puzzles(path, fmt), name or os.path.basename(path), batch_size, conn=conn)
 
+
+def add_puzzles(puzzles, name, batch_size=IMPORT_BATCH, solutions=None, conn=None) -> tuple:
+    """
+    Insert the puzzles of an iterable as they are produced, `batch_size` puzzles
+    per transaction. Puzzles which are already stored, in the database or earlier
+    in the iterable, are skipped.
+    :param name: Prefix of the names. The n:th puzzle is named "<name> <m + n>", where m
+        is the highest number already stored with the prefix, so that the names are free.
+    :param solutions: Number of solutions stored for every puzzle, for example 1
+        for generated puzzles. None if not counted.
+    :return: Tuple (read, added) of the number of puzzles read and added.
+    """
+    conn = conn or get_conn()
     current_time = pytz.utc.localize(datetime.datetime.utcnow())
-    value = json.dumps(puzzle)
-    db_conn.execute(insert_stmt, (name, value, current_time, name))
-    db_conn.commit()
+    insert_stmt = ("INSERT INTO puzzles (name, puzzle, time, givens, solutions) SELECT ?, ?, ?, ?, ?"
+                   " WHERE NOT EXISTS (SELECT 1 FROM puzzles WHERE puzzle = ?)")
+    last = _last_number(name, conn)
+    read = 0
+    added = 0
+    rows = []
+    for puzzle in puzzles:
+        read += 1
+        value = puzzle_io.pack(puzzle)
+        rows.append((f"{name} {last + read}", value, current_time, count_givens(puzzle), solutions, value))
+        if len(rows) == batch_size:
+            added += _insert_batch(conn, insert_stmt, rows)
+            rows = []
+    if rows:
+        added += _insert_batch(conn, insert_stmt, rows)
+    return read, added
+
+
+def _last_number(name, conn) -> int:
+    """
+    :return: The highest n of the names "<name> <n>" in the database, 0 if there are none.
+    """
+    # The names starting with "<name> " sort between "<name> " and "<name>!", which the name index finds
+    rows = conn.execute("SELECT name FROM puzzles WHERE name >= ? AND name < ?", (name + " ", name + "!"))
+    numbers = (row[0][len(name) + 1:] for row in rows)
+    return max((int(number) for number in numbers if number.isdecimal()), default=0)
+
+
+def _insert_batch(conn, insert_stmt, rows) -> int:
+    with conn:
+        return conn.executemany(insert_stmt, rows).rowcount
+
+
+def load_solution(id, conn=None):
+    """
+    Load the stored solve result of a puzzle.
+    :return: Tuple (status, solution). Status is "solved" or "unsolvable", or None
+        if the puzzle has not been solved yet. Solution is None unless solved.
+    """
+    conn = conn or get_conn()
+    status, solution = conn.execute("SELECT status, solution FROM puzzles WHERE _id = ?", (id,)).fetchone()
+    return status, puzzle_io.unpack(solution) if solution is not None else None
+
+
+def save_solution(id, solution, stats, conn=None) -> None:
+    """
+    Store the result of a solve together with its `solver.SolveStats`.
+    """
+    conn = conn or get_conn()
+    conn.execute("UPDATE puzzles SET solution = ?, status = ?, solve_seconds = ?, solve_nodes = ? WHERE _id = ?",
+                 (puzzle_io.pack(solution) if solution is not None else None, stats.status, stats.total_time,
+                  stats.nodes, id))
+    conn.commit()
+
+
+def get_solution(id, progress=None, cancel=None, conn=None):
+    """
+    Return the solution of a puzzle, solving it and storing the result only if
+    it has not been solved before.
+    :param progress: Progress callback passed to `solver.solve`. A stopped solve is not stored.
+    :param cancel: `solver.CancelToken` passed to `solver.solve`.
+    :return: Solution, or None if the puzzle has no solution or the solve was stopped.
+    """
+    conn = conn or get_conn()
+    status, solution = load_solution(id, conn)
+    if status is not None:
+        return solution
+    solution, stats = solve(load_puzzle(id, conn), progress=progress, cancel=cancel, stats=True,
+                            cages=load_cages(id, conn), **SOLVE_OPTIONS)
+    if stats.status in ("solved", "unsolvable"):
+        save_solution(id, solution, stats, conn)
+    return solution
+
+
+def backfill_solutions(conn=None, batch=BACKFILL_BATCH) -> int:
+    """
+    Solve and store every puzzle which has not been solved yet. This is run by the
+    `backfill_solutions` tool, the game only solves the puzzles it opens.
+    :return: Number of puzzles solved.
+    """
+    conn = conn or get_conn()
+    solved = 0
+    while True:
+        rows = conn.execute("SELECT _id, puzzle, cages FROM puzzles WHERE status IS NULL ORDER BY _id LIMIT ?",
+                            (batch,)).fetchall()
+        if not rows:
+            return solved
+        for id, puzzle, cages in rows:
+            solution, stats = solve(puzzle_io.unpack(puzzle), stats=True, cages=_decode_cages(cages),
+                                    **SOLVE_OPTIONS)
+            save_solution(id, solution, stats, conn)
+            solved += 1
+
+
+def ungraded_puzzles(after_id=0, limit=IMPORT_BATCH, conn=None) -> list:
+    """
+    Return one page of the puzzles which have not been graded, like `list_puzzles`.
+    The grader has no cage techniques, so killer sudokus are not returned.
+    :return: List of (id, puzzle) tuples.
+    """
+    conn = conn or get_conn()
+    rows = conn.execute("SELECT _id, puzzle FROM puzzles WHERE difficulty IS NULL AND cages IS NULL AND _id > ?"
+                        " ORDER BY _id LIMIT ?", (after_id, limit)).fetchall()
+    return [(id, puzzle_io.unpack(puzzle)) for id, puzzle in rows]
+
+
+def save_grades(grades, conn=None) -> None:
+    """
+    Store the grades of many puzzles in one transaction.
+    :param grades: Iterable of (id, grade) tuples, the grades from `grader.grade`.
+        Puzzles without a solution are stored with the difficulty -1.
+    """
+    conn = conn or get_conn()
+    with conn:
+        conn.executemany("UPDATE puzzles SET difficulty = ?, level = ?, techniques = ?, solutions = ? WHERE _id = ?",
+                         ((grade["score"] if grade["status"] == "solved" else -1, grade["level"],
+                           json.dumps(grade["techniques"]), grade["solutions"], id) for id, grade in grades))
+
+
+def load_grade(id, conn=None):
+    """
+    Load the stored grade of a puzzle.
+    :return: Tuple (difficulty, level, techniques), all None if not graded.
+    """
+    conn = conn or get_conn()
+    difficulty, level, techniques = conn.execute("SELECT difficulty, level, techniques FROM puzzles WHERE _id = ?",
+                                                 (id,)).fetchone()
+    return difficulty, level, json.loads(techniques) if techniques is not None else None
 
 
 def close_db():
-    db_conn.close()
+    global _db_conn
+    if _db_conn is not None:
+        _db_conn.close()
+        _db_conn = None
@@ -1,5 +1,9 @@
 # Constants
 FPS = 60
+# Steps of the solver shown per second when a visual solve is replayed, and the
+# highest speed the arrow keys can set
+REPLAY_SPEED = 60
+REPLAY_MAX_SPEED = 1 << 20
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
 SELECTED_COLOR = (0, 255, 0)
@@ -7,10 +11,14 @@ GREY = (120, 120, 120)
 RED = (255, 0, 0)
 BLUE = (71, 185, 230)
 DARK_BLUE = (0, 0, 255)
+LIGHT_BLUE = (160, 215, 240)
 
 FONT_SIZE_LARGE = 50
 FONT_SIZE_NORMAL = 40
 FONT_SIZE_INFO = 20
+FONT_SIZE_CAGE = 16
+# Distance of the killer cage borders from the cell edges
+CAGE_MARGIN = 4
 
 # window settings
 w_width = 540
@@ -19,7 +27,8 @@ w_height = 690
 # board settings
 width = 540
 height = 540
-cell_size = width // 9
+# Sizes of the boards the N key switches between, from `solver.SIZES`
+board_sizes = [4, 9, 16, 25]
 
 # button settings
 btn_width = width / 2
@@ -41,6 +50,13 @@ controls = {"Select cell": "Arrow keys",
             "Close game": "Esc",
             "Solve": "Space",
             "Solve visually": "V",
+            "Values above 9": "Shift + A-P",
+            "Board size": "N",
+            "Pause replay": "Space",
+            "Replay speed": "Up / Down",
+            "Replay step": "Left / Right",
+            "Skip in replay": "Page Up / Page Down",
+            "Stop replay": "Esc",
             }
 
 # puzzles
@@ -117,3 +133,13 @@ puzzle_anti_backtracking = [
     [0, 0, 2, 0, 1, 0, 0, 0, 0],
     [0, 0, 0, 0, 5, 0, 0, 0, 9],
 ]
+
+# Puzzles added to the database on start, by name
+preset_puzzles = {"easy": puzzle_easy,
+                  "normal": puzzle_normal,
+                  "hard": puzzle_hard,
+                  "very hard": puzzle_very_hard,
+                  "empty": puzzle_empty,
+                  "impossible": puzzle_impossible,
+                  "anti backtracking": puzzle_anti_backtracking,
+                  }
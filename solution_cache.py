@@ -0,0 +1,114 @@
+import collections
+
+import canonical
+import solver
+
+# Default number of entries kept in a SolutionCache
+CACHE_SIZE = 10000
+# Default number of exact puzzles kept in front of the canonical entries
+EXACT_CACHE_SIZE = 1000
+
+
+class SolutionCache:
+    """
+    Bounded LRU cache of solutions in front of `solver.solve`. A solution is stored
+    for the canonical form of the puzzle, so a relabelled, transposed or reordered
+    copy of a solved puzzle is answered from the cache by mapping the stored solution
+    back. Finding the canonical form takes about 100 microseconds, the exact puzzles
+    seen last are kept in a smaller separate cache which answers a repeated input in
+    a few microseconds. Puzzles seen once do not evict the canonical entries.
+    For a puzzle with several solutions the cached solution may differ from the one
+    `solver.solve` would return, but it is always a valid solution.
+    """
+    def __init__(self, maxsize=CACHE_SIZE, engine="bitmask", strategy="mrv", exact_size=EXACT_CACHE_SIZE):
+        """
+        :param maxsize: Number of canonical puzzles kept.
+        :param exact_size: Number of exact puzzles kept, 0 to only use the canonical forms.
+        """
+        if maxsize < 1 or exact_size < 0:
+            raise ValueError("Cache size must be positive and the exact cache size not negative")
+        self.maxsize = maxsize
+        self.exact_size = exact_size
+        self.engine = engine
+        self.strategy = strategy
+        # Canonical puzzle as 81 bytes -> solution of that puzzle, or None if it has none
+        self._entries = collections.OrderedDict()
+        # The same for the puzzles as they were given
+        self._exact = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Puzzles which were too symmetric to canonicalize and were solved directly
+        self.uncacheable = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def solve(self, puzzle):
+        """
+        Solve the puzzle like `solver.solve`, using the cache when possible.
+        """
+        raw_key = bytes(value for row in puzzle for value in row)
+        if raw_key in self._exact:
+            self.hits += 1
+            return self._get(self._exact, raw_key)
+
+        canonical_form = canonical.canonicalize(puzzle)
+        if canonical_form is None:
+            self.uncacheable += 1
+            return solver.solve(puzzle, engine=self.engine, strategy=self.strategy)
+        key, transform = canonical_form
+        if key in self._entries:
+            self.hits += 1
+            solution = self._get(self._entries, key)
+        else:
+            self.misses += 1
+            solution = solver.solve(transform.apply(puzzle), engine=self.engine, strategy=self.strategy)
+            self._put(self._entries, key, solution)
+            self.evictions += self._trim(self._entries, self.maxsize)
+        if solution is not None:
+            solution = transform.invert(solution)
+        if self.exact_size:
+            self._put(self._exact, raw_key, solution)
+            self._trim(self._exact, self.exact_size)
+        return solution
+
+    def info(self) -> dict:
+        lookups = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "uncacheable": self.uncacheable,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "exact_entries": len(self._exact),
+                "exact_size": self.exact_size,
+                }
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._exact.clear()
+
+    @staticmethod
+    def _get(entries, key):
+        entries.move_to_end(key)
+        solution = entries[key]
+        return None if solution is None else [row.copy() for row in solution]
+
+    @staticmethod
+    def _put(entries, key, solution) -> None:
+        entries[key] = None if solution is None else [row.copy() for row in solution]
+        entries.move_to_end(key)
+
+    @staticmethod
+    def _trim(entries, maxsize) -> int:
+        """
+        Drop the least recently used entries over `maxsize`.
+        :return: Number of entries dropped.
+        """
+        evicted = 0
+        while len(entries) > maxsize:
+            entries.popitem(last=False)
+            evicted += 1
+        return evicted
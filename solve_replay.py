@@ -0,0 +1,77 @@
+import solver
+
+# Number of steps between two saved states, a seek replays at most this many steps
+CHECKPOINT_INTERVAL = 1024
+# Kind of the cells which no step has changed
+NO_STEP = 255
+
+
+class Replay:
+    """
+    Replay a solve trace from `solver.solve` on its puzzle. The replay only keeps the
+    state of the grid, so it does not depend on pygame: the GUI seeks to the step of
+    the current frame and redraws the cells which changed.
+    """
+    def __init__(self, puzzle, trace):
+        """
+        :param puzzle: List containing the lists of values of the each row, 0 for empty cells.
+        :param trace: Steps encoded by `solver.trace_step`.
+        """
+        self.trace = trace
+        # Value of every cell and the kind of the last step which changed it
+        self.grid = bytearray(value for row in puzzle for value in row)
+        self.kinds = bytearray([NO_STEP]) * len(self.grid)
+        self.position = 0
+        # The state before step n * CHECKPOINT_INTERVAL, saved in one pass over the
+        # trace so that seeking backwards does not replay from the start
+        self._checkpoints = [(bytes(self.grid), bytes(self.kinds))]
+        for n in range(CHECKPOINT_INTERVAL, len(trace) + 1, CHECKPOINT_INTERVAL):
+            self._apply(n)
+            self._checkpoints.append((bytes(self.grid), bytes(self.kinds)))
+        self._restore(0)
+
+    def __len__(self):
+        return len(self.trace)
+
+    @property
+    def finished(self) -> bool:
+        return self.position >= len(self.trace)
+
+    def seek(self, position) -> list:
+        """
+        Move to the state after the first `position` steps. Any number of steps can be
+        skipped, only the end state is computed.
+        :return: List of the cells whose value or kind changed.
+        """
+        position = max(0, min(position, len(self.trace)))
+        grid = bytes(self.grid)
+        kinds = bytes(self.kinds)
+        checkpoint = position // CHECKPOINT_INTERVAL
+        if position < self.position or checkpoint > self.position // CHECKPOINT_INTERVAL:
+            self._restore(checkpoint)
+        self._apply(position)
+        return [k for k in range(len(grid))
+                if grid[k] != self.grid[k] or kinds[k] != self.kinds[k]]
+
+    def cell(self, k) -> tuple:
+        """
+        :return: Tuple (value, kind) of cell `k`, the kind is one of the
+            `solver.TRACE_KINDS` indices or `NO_STEP`.
+        """
+        return self.grid[k], self.kinds[k]
+
+    def _restore(self, checkpoint) -> None:
+        grid, kinds = self._checkpoints[checkpoint]
+        self.grid[:] = grid
+        self.kinds[:] = kinds
+        self.position = checkpoint * CHECKPOINT_INTERVAL
+
+    def _apply(self, position) -> None:
+        grid = self.grid
+        kinds = self.kinds
+        for step in self.trace[self.position:position]:
+            kind = step & 7
+            k = step >> 8
+            grid[k] = 0 if kind == solver.TRACE_UNDO else step >> 3 & 31
+            kinds[k] = kind
+        self.position = position
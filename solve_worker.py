@@ -0,0 +1,129 @@
+import array
+import multiprocessing
+import queue
+
+import puzzles_db
+import solve_replay
+import solver
+
+
+def _solve(puzzle, puzzle_id, results, cancel_event, trace=False, cages=None) -> None:
+    """
+    Solve a puzzle in the worker process and report through the `results` queue:
+    ("progress", steps) every `solver.PROGRESS_INTERVAL` search steps, then
+    ("done", solution) or ("cancelled", None).
+    :param puzzle_id: Database id of the puzzle, None for a puzzle which has not been saved.
+    :param trace: If True, the puzzle is solved again with a trace, even if its solution
+        is stored, and a ("replay", `solve_replay.Replay`) message comes before "done".
+    :param cages: `solver.Cages` of a killer sudoku. A saved puzzle is solved with its stored cages.
+    """
+    cancel = solver.CancelToken(cancel_event)
+
+    def on_progress(steps):
+        results.put(("progress", steps))
+        return False
+
+    if trace:
+        steps = array.array("I")
+        solution = solver.solve(puzzle, progress=on_progress, cancel=cancel, trace=steps, cages=cages,
+                                **puzzles_db.SOLVE_OPTIONS)
+        if not cancel.cancelled:
+            # The checkpoints of the replay are built here to keep the game loop running
+            results.put(("replay", solve_replay.Replay(puzzle, steps)))
+    elif puzzle_id is not None:
+        # sqlite connections can not be shared between processes
+        conn = puzzles_db.connect()
+        try:
+            solution = puzzles_db.get_solution(puzzle_id, progress=on_progress, cancel=cancel, conn=conn)
+        finally:
+            conn.close()
+    else:
+        solution = solver.solve(puzzle, progress=on_progress, cancel=cancel, cages=cages)
+    results.put(("cancelled", None) if cancel.cancelled else ("done", solution))
+
+
+class SolveWorker:
+    """
+    Solve one puzzle at a time in a separate process, so that the pygame loop keeps
+    its frame rate however long the solve takes. A process is used instead of a
+    thread because a thread running the solver would hold the GIL for most of
+    each frame. Call `poll` once per frame.
+    """
+    def __init__(self):
+        self._process = None
+        self._results = None
+        self._cancel = None
+        # Set by `cancel`, the result of a cancelled solve is not reported
+        self.cancelled = False
+        # Search steps reported by the running solve
+        self.steps = 0
+        # `solve_replay.Replay` of the last solve started with a trace
+        self.replay = None
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None
+
+    def start(self, puzzle, puzzle_id=None, trace=False, cages=None) -> None:
+        """
+        :param trace: If True, record the steps of the solve. When it is done the
+            `replay` attribute holds a `solve_replay.Replay` of them.
+        :param cages: `solver.Cages` of a killer sudoku.
+        """
+        if self.running:
+            raise RuntimeError("A solve is already running")
+        self._results = multiprocessing.Queue()
+        self._cancel = multiprocessing.Event()
+        self.steps = 0
+        self.replay = None
+        self.cancelled = False
+        self._process = multiprocessing.Process(target=_solve,
+                                                args=(puzzle, puzzle_id, self._results, self._cancel, trace, cages),
+                                                daemon=True)
+        self._process.start()
+
+    def cancel(self) -> None:
+        """
+        Ask the running solve to stop. `poll` returns ("cancelled", None) once it has,
+        also if the solve finished before it noticed.
+        """
+        if self.running:
+            self._cancel.set()
+            self.cancelled = True
+            self.replay = None
+
+    def poll(self):
+        """
+        Handle the messages of the worker without waiting.
+        :return: Tuple ("done", solution) or ("cancelled", None) when the solve has
+            ended, ("failed", None) if the worker died, otherwise None.
+        """
+        if not self.running:
+            return None
+        alive = self._process.is_alive()
+        while True:
+            try:
+                # After the worker has exited its last messages may still be in the pipe. An
+                # exiting process flushes its queue first, so they can be read without waiting.
+                kind, value = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                self.steps = value
+            elif kind == "replay":
+                if not self.cancelled:
+                    self.replay = value
+            else:
+                self._finish()
+                return ("cancelled", None) if self.cancelled else (kind, value)
+        if not alive:
+            self._finish()
+            return "failed", None
+        return None
+
+    def _finish(self) -> None:
+        self._process.join()
+        self._process = None
+        self._results.close()
+        self._results = None
+        self._cancel = None
@@ -1,141 +1,1236 @@
-import copy
-import pygame
+import itertools
+import math
+import threading
+import time
 
+import solver_dlx
 
-def solve(puzzle):
-    temp_puzzle = copy.deepcopy(puzzle)
+# Candidates are stored as 9-bit masks: digit d (1-9) is bit d - 1, so
+# ALL_DIGITS means every digit is still possible in a cell or a unit.
+ALL_DIGITS = 0x1FF
+DIGIT_BIT = [0] + [1 << (d - 1) for d in range(1, 10)]
+BIT_COUNT = [bin(mask).count("1") for mask in range(ALL_DIGITS + 1)]
+MASK_DIGITS = [tuple(d for d in range(1, 10) if mask & DIGIT_BIT[d]) for mask in range(ALL_DIGITS + 1)]
 
-    run = True
+# The puzzle is flattened to 81 cells in row-major order. These tables map a
+# cell index to its row, column and 3x3 square and list the cells of each unit.
+CELL_ROW = [k // 9 for k in range(81)]
+CELL_COL = [k % 9 for k in range(81)]
+CELL_BOX = [(k // 27) * 3 + (k % 9) // 3 for k in range(81)]
+ROW_CELLS = [[k for k in range(81) if CELL_ROW[k] == i] for i in range(9)]
+COL_CELLS = [[k for k in range(81) if CELL_COL[k] == i] for i in range(9)]
+BOX_CELLS = [[k for k in range(81) if CELL_BOX[k] == i] for i in range(9)]
+# Every cell sharing a row, column or 3x3 square with the cell, excluding itself
+PEERS = [sorted(set(ROW_CELLS[CELL_ROW[k]] + COL_CELLS[CELL_COL[k]] + BOX_CELLS[CELL_BOX[k]]) - {k})
+         for k in range(81)]
+UNITS = ROW_CELLS + COL_CELLS + BOX_CELLS
+# The intersections of a row or a column with a 3x3 square, as tuples (cells of the
+# intersection, rest of the line, rest of the square)
+SEGMENTS = [([k for k in line if k in box], [k for k in line if k not in box], [k for k in box if k not in line])
+            for line in ROW_CELLS + COL_CELLS for box in BOX_CELLS if set(line) & set(box)]
 
-    while run:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                exit()
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
-                    exit()
+# Sizes of the supported boards. The tables above are for 9x9 boards, the other
+# sizes are solved with the tables of a `Geometry`.
+SIZES = (4, 9, 16, 25)
 
-        possible_values = [[get_possible_values(temp_puzzle, i, j) for j in range(9)] for i in range(9)]
+# Number of search steps between two calls of the progress callback
+PROGRESS_INTERVAL = 1024
+# Number of search steps between two checks of the timeout and the cancel token
+LIMIT_INTERVAL = 64
 
-        # Fill unique values
-        if fill_unique(possible_values, temp_puzzle):
-            continue
+# Kinds of the steps recorded in a solve trace: a value removed by the search, a value
+# guessed by the search, and the values filled by each of the singles rules
+TRACE_UNDO = 0
+TRACE_GUESS = 1
+TRACE_UNIQUE = 2
+TRACE_SQUARE = 3
+TRACE_ROW = 4
+TRACE_COL = 5
+TRACE_KINDS = ["undo", "guess", "unique", "square", "row", "col"]
 
-        # Check if possible value appears once in a 3x3 square
-        if fill_square(possible_values, temp_puzzle):
-            continue
 
-        # Check if possible value appears once in a row
-        if fill_row(possible_values, temp_puzzle):
-            continue
+def trace_step(kind, k, value) -> int:
+    """
+    Encode a step of a solve trace as one integer: the kind in the lowest 3 bits,
+    the value in the next 5 bits and the cell above them.
+    """
+    return k << 8 | value << 3 | kind
 
-        # Check if possible value appears once in a column
-        if fill_col(possible_values, temp_puzzle):
-            continue
 
-        run = False
+def decode_step(step) -> tuple:
+    """
+    Decode a step from `trace_step`.
+    :return: Tuple (kind, cell, value).
+    """
+    return step & 7, step >> 8, step >> 3 & 31
+
+
+def _traced(fill, kind, trace, candidates, grid, rows, cols, boxes, queue, *args) -> int:
+    """
+    Call one of the fill functions and append the cells it filled to the trace. The
+    filled cells are appended to the queue in order, also when the fill runs into a
+    contradiction, so they are taken from there.
+    """
+    start = len(queue)
+    try:
+        return fill(candidates, grid, rows, cols, boxes, queue, *args)
+    finally:
+        for k in queue[start:]:
+            trace.append(k << 8 | grid[k] << 3 | kind)
+
 
-    backtracking(temp_puzzle)
-    # print(temp_puzzle)
+class _Cancelled(Exception):
+    """
+    Stops a solve. `status` is the `SolveStats` status it ends with.
+    """
+    def __init__(self, status="cancelled"):
+        super().__init__(status)
+        self.status = status
+
+
+class CancelToken:
+    """
+    Cancels a running solve from another thread: pass the token to `solve` and call
+    `cancel`. The solve notices it within a few search steps.
+    :param event: Event to wait on, by default a new `threading.Event`. Pass a
+        `multiprocessing.Event` to cancel a solve running in another process.
+    """
+    def __init__(self, event=None):
+        self._event = event if event is not None else threading.Event()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+
+class _Contradiction(Exception):
+    pass
+
+
+class _Monitor:
+    """
+    Count the search steps and call the `progress` callback every `interval` steps.
+    The callback gets the number of steps so far and returns True to cancel the solve.
+    The limits are checked on the first step and then at most every `LIMIT_INTERVAL`
+    steps so that a step only costs one comparison.
+    :param deadline: Value of `time.perf_counter()` at which the solve times out.
+    :param max_nodes: Number of search nodes after which the solve is stopped.
+    :param cancel: `CancelToken` which stops the solve when cancelled.
+    """
+    def __init__(self, progress=None, interval=PROGRESS_INTERVAL, deadline=None, max_nodes=None, cancel=None):
+        self.progress = progress
+        self.interval = interval
+        self.deadline = deadline
+        self.max_nodes = max_nodes
+        self.cancel = cancel
+        self.nodes = 0
+        self.next_report = interval if progress is not None else None
+        self.next_check = 1
+
+    def __call__(self) -> None:
+        self.nodes += 1
+        if self.nodes >= self.next_check:
+            self._check()
+
+    def check(self) -> None:
+        """
+        Check the cancel token and the timeout without counting a step, for the work
+        done before the first step.
+        """
+        if self.cancel is not None and self.cancel.cancelled:
+            raise _Cancelled("cancelled")
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise _Cancelled("timeout")
+
+    def _check(self) -> None:
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise _Cancelled("node_limit")
+        self.check()
+        if self.next_report is not None and self.nodes >= self.next_report:
+            self.next_report = self.nodes + self.interval
+            if self.progress(self.nodes):
+                raise _Cancelled("cancelled")
+        self._schedule()
+
+    def _schedule(self) -> None:
+        checks = []
+        if self.next_report is not None:
+            checks.append(self.next_report)
+        if self.max_nodes is not None:
+            checks.append(self.max_nodes + 1)
+        if self.deadline is not None or self.cancel is not None:
+            checks.append(self.nodes + LIMIT_INTERVAL)
+        self.next_check = min(checks)
+
+
+class SolveStats:
+    """
+    Statistics of a single solve, returned by `solve` when called with `stats=True`.
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        # "solved", "unsolvable", or why the solve was stopped: "cancelled",
+        # "timeout" or "node_limit". The other statistics of a stopped solve cover
+        # the work done until it was stopped.
+        self.status = None
+        # Cells filled by each of the singles rules before the search
+        self.filled = {"unique": 0, "square": 0, "row": 0, "col": 0}
+        self.propagation_passes = 0
+        # Search nodes visited and, for the bitmask engine, nodes where no value fitted
+        self.nodes = 0
+        self.dead_ends = 0
+        # Candidates removed by each elimination pass. With passes the singles and the
+        # eliminations are also counted when propagating during the search.
+        self.eliminated = {}
+        # Seconds spent in each phase of the solve
+        self.times = {"setup": 0.0, "propagation": 0.0, "search": 0.0}
+
+    @property
+    def total_time(self) -> float:
+        return sum(self.times.values())
+
+    def as_dict(self) -> dict:
+        return {"engine": self.engine,
+                "status": self.status,
+                "filled": dict(self.filled),
+                "propagation_passes": self.propagation_passes,
+                "nodes": self.nodes,
+                "dead_ends": self.dead_ends,
+                "eliminated": dict(self.eliminated),
+                "times": dict(self.times),
+                "total_time": self.total_time,
+                }
+
+    def __repr__(self):
+        return f"SolveStats({self.as_dict()})"
+
+
+def solve(puzzle, progress=None, progress_interval=PROGRESS_INTERVAL, engine="bitmask", strategy="first",
+          value_order="ascending", stats=False, passes=(), timeout=None, max_nodes=None, cancel=None, trace=None,
+          cages=None):
+    """
+    Solve the sudoku without modifying `puzzle`. The solver does not depend on pygame,
+    a GUI can stay responsive by polling its events in the `progress` callback.
+    :param puzzle: List containing the lists of values of the each row, 0 for empty cells.
+        The board can have any size in `SIZES`. Boards other than 9x9 are always solved
+        by propagating the singles and branching on the cell with the fewest candidates,
+        so the engine, strategy, value order and passes only apply to 9x9 boards.
+    :param progress: Optional callback `progress(steps) -> bool` called every
+        `progress_interval` search steps. Returning True cancels the solve.
+    :param progress_interval: Number of search steps between the progress calls.
+    :param engine: Name of the search engine in `ENGINES`. "bitmask" fills the singles and
+        backtracks, "dlx" solves the puzzle as an exact cover problem, which is much
+        faster on puzzles made against backtracking. For puzzles with exactly one
+        solution both engines return the same result.
+    :param strategy: Name of the cell selection in `STRATEGIES` used by the backtracking.
+        "first" branches on the first empty cell, "mrv" on the cell with the fewest candidates.
+    :param value_order: Name of the order in `VALUE_ORDERS` in which the backtracking tries
+        the candidates of a cell. "ascending" tries 1-9 in order, "lcv" tries first the value
+        which removes the fewest candidates from the other cells.
+    :param stats: If True, also return a `SolveStats` of the work done in each phase.
+        Without it no statistics are collected.
+    :param passes: Names of the elimination passes in `PASSES` run by the bitmask engine
+        when the singles rules are stuck, tried in the given order. With passes the
+        search branches on the cell with the fewest candidates and propagates after
+        every guess, so the strategy and the value order do not apply.
+    :param timeout: Seconds after which the solve is stopped with the status "timeout".
+    :param max_nodes: Number of search nodes after which the solve is stopped with the
+        status "node_limit". These are the nodes counted in `SolveStats.nodes`, so a solve
+        stopped by the limit reports exactly `max_nodes` nodes.
+    :param cancel: `CancelToken` which stops the solve with the status "cancelled".
+    :param trace: Optional list, or array of unsigned ints, where every value placed or
+        removed is appended as a step encoded by `trace_step`, in the order the solver
+        made them. Replaying the steps on the puzzle gives the solution. Only the
+        bitmask engine records a trace.
+    :param cages: Optional `Cages`, or the (cells, total) pairs to build one, to solve
+        a 9x9 killer sudoku. Only the bitmask engine solves cages, and like with passes
+        it branches on the cell with the fewest candidates.
+    :return: Solved puzzle, or None if the puzzle has no solution or the solve was stopped.
+        Use `stats=True` to tell these apart from the status.
+        With the default strategy and value order the solution of a puzzle with several
+        solutions is the first one in row-major order, other settings may return another one.
+        With `stats=True` a tuple (solution, SolveStats).
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown solver engine: {engine}")
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown backtracking strategy: {strategy}")
+    if value_order not in VALUE_ORDERS:
+        raise ValueError(f"Unknown value order: {value_order}")
+    for name in passes:
+        if name not in PASSES:
+            raise ValueError(f"Unknown elimination pass: {name}")
+    if trace is not None and engine != "bitmask":
+        raise ValueError("Only the bitmask engine records a trace")
+    if cages is not None:
+        if len(puzzle) != 9 or engine != "bitmask":
+            raise ValueError("Only the bitmask engine solves cages, on 9x9 boards")
+        if not isinstance(cages, Cages):
+            cages = Cages(cages)
+    monitor = None
+    if progress is not None or timeout is not None or max_nodes is not None or cancel is not None:
+        deadline = time.perf_counter() + timeout if timeout is not None else None
+        monitor = _Monitor(progress, progress_interval, deadline, max_nodes, cancel)
+    solve_stats = SolveStats(engine) if stats else None
+    try:
+        if len(puzzle) != 9:
+            solution = _solve_nxn(puzzle, monitor, solve_stats, trace)
+        else:
+            solution = ENGINES[engine](puzzle, monitor, STRATEGIES[strategy], VALUE_ORDERS[value_order], solve_stats,
+                                       [(name, PASSES[name]) for name in passes], trace, cages)
+    except _Cancelled as stop:
+        solution = None
+        if stats:
+            solve_stats.status = stop.status
+    if not stats:
+        return solution
+    if solve_stats.status is None:
+        solve_stats.status = "unsolvable" if solution is None else "solved"
+    return solution, solve_stats
+
+
+def _solve(puzzle, monitor, select_cell, order_values, stats, passes, trace=None, cages=None):
+    if stats is not None:
+        start = time.perf_counter()
+    grid = [value for row in puzzle for value in row]
+    masks = init_masks(grid)
+    if stats is not None:
+        stats.times["setup"] = time.perf_counter() - start
+        start = time.perf_counter()
+    if masks is None:
+        return None
+    rows, cols, boxes = masks
+
+    candidates = get_candidates(grid, rows, cols, boxes)
+    try:
+        propagate(candidates, grid, rows, cols, boxes, stats=stats, passes=passes, trace=trace, cages=cages)
+    except _Contradiction:
+        return None
+    finally:
+        if stats is not None:
+            stats.times["propagation"] = time.perf_counter() - start
+            start = time.perf_counter()
+
+    try:
+        # The propagation can take a while on its own
+        if monitor is not None:
+            monitor.check()
+        if passes or cages is not None:
+            found = []
+            propagating_search(candidates, grid, rows, cols, boxes, found, 1, passes, monitor, stats, trace, cages)
+            grid = found[0] if found else grid
+        else:
+            backtracking(grid, rows, cols, boxes, monitor, select_cell, order_values, stats, trace)
+    finally:
+        if stats is not None:
+            stats.times["search"] = time.perf_counter() - start
+    temp_puzzle = [grid[9 * i:9 * i + 9] for i in range(9)]
     if check_solution(temp_puzzle):
         return temp_puzzle
     else:
         return None
 
 
-def fill_unique(possible_values, temp_puzzle) -> bool:
-    for i in range(9):
-        for j in range(9):
-            if possible_values[i][j] is not None:
-                value_set = possible_values[i][j]
-                # If only one possible value in cell, fill it
-                if len(value_set) == 1:
-                    temp_puzzle[i][j] = next(iter(value_set))
-                    # print(f"first loop: {i}, {j}, {temp_puzzle[i][j]}")
-                    return True
-    return False
+def _solve_dlx(puzzle, monitor, select_cell, order_values, stats, passes, trace=None, cages=None):
+    # Algorithm X always branches on the most constrained column, so the
+    # backtracking strategy and the elimination passes do not apply here
+    if stats is not None:
+        progress_monitor = monitor
 
+        def monitor():
+            # Checked first so that a node stopped by the limit is not counted
+            if progress_monitor is not None:
+                progress_monitor()
+            stats.nodes += 1
 
-def fill_row(possible_values, temp_puzzle) -> bool:
-    for i in range(9):
-        for j in range(9):
-            if possible_values[i][j] is not None:
-                value_set = possible_values[i][j]
-                for index, row_set in enumerate(possible_values[i]):
-                    if row_set is not None and index != j:
-                        value_set = value_set.difference(row_set)
-                if len(value_set) == 1:
-                    temp_puzzle[i][j] = next(iter(value_set))
-                    # print(f"row loop: {i}, {j}, {temp_puzzle[i][j]}")
-                    return True
-    return False
+        start = time.perf_counter()
+    try:
+        grid = solver_dlx.solve_grid([value for row in puzzle for value in row], monitor)
+    finally:
+        if stats is not None:
+            stats.times["search"] = time.perf_counter() - start
+    if grid is None:
+        return None
+    return [grid[9 * i:9 * i + 9] for i in range(9)]
 
 
-def fill_col(possible_values, temp_puzzle) -> bool:
-    for i in range(9):
-        for j in range(9):
-            value_set = [possible_values[j][i] for j in range(9)]
-            if value_set[j] is not None:
-                for index, col_set in enumerate(value_set):
-                    if col_set is not None and value_set[j] is not None and index != j:
-                        value_set[j] = value_set[j].difference(col_set)
-                if len(value_set[j]) == 1:
-                    temp_puzzle[j][i] = next(iter(value_set[j]))
-                    # print(f"col loop: {j}, {i}, {temp_puzzle[j][i]}")
-                    return True
-    return False
+ENGINES = {"bitmask": _solve, "dlx": _solve_dlx}
 
 
-def fill_square(possible_values, temp_puzzle) -> bool:
-    for n in range(3):
-        for m in range(3):
-            value_set = []
-            for i in range(3*n, 3*n + 3):
-                for j in range(3*m, 3*m + 3):
-                    if possible_values[i][j] is not None:
-                        value_set.append(possible_values[i][j])
-                    else:
-                        value_set.append(None)
-            for k in range(9):
-                value_set_temp = value_set.copy()
-                for index, square_set in enumerate(value_set_temp):
-                    if square_set is not None and value_set_temp[k] is not None and index != k:
-                        value_set_temp[k] = value_set_temp[k].difference(square_set)
-                if value_set_temp[k] is not None and len(value_set_temp[k]) == 1:
-                    temp_puzzle[n*3 + k // 3][m*3 + k % 3] = next(iter(value_set_temp[k]))
-                    # print(f"square loop: {n*3 + k // 3}, {m*3 + k % 3}, {temp_puzzle[n*3 + k // 3][m*3 + k % 3]}")
-                    return True
-    return False
+def count_solutions(puzzle, limit=2, passes=(), cages=None) -> int:
+    """
+    Count the solutions of a puzzle, stopping as soon as `limit` have been found.
+    With the default limit this tells whether the puzzle has no solution (0), a
+    unique solution (1) or several solutions (2). The singles are propagated after
+    every guess, which keeps the search to a few hundred nodes even for hard puzzles.
+    :param puzzle: List containing the lists of values of the each row, 0 for empty cells.
+        The board can have any size in `SIZES`.
+    :param limit: Highest count of interest, must be at least 1.
+    :param passes: Names of the elimination passes in `PASSES` to propagate with, only
+        used on 9x9 boards.
+    :param cages: Optional `Cages`, or the (cells, total) pairs to build one, of a 9x9
+        killer sudoku.
+    :return: Number of solutions, at most `limit`.
+    """
+    if limit < 1:
+        raise ValueError("Limit must be positive")
+    if cages is not None:
+        if len(puzzle) != 9:
+            raise ValueError("Cages are only supported on 9x9 boards")
+        if not isinstance(cages, Cages):
+            cages = Cages(cages)
+    if len(puzzle) != 9:
+        return len(_search_nxn_puzzle(puzzle, limit))
+    grid = [value for row in puzzle for value in row]
+    masks = init_masks(grid)
+    if masks is None:
+        return 0
+    rows, cols, boxes = masks
+    passes = [(name, PASSES[name]) for name in passes]
+    candidates = get_candidates(grid, rows, cols, boxes)
+    try:
+        propagate(candidates, grid, rows, cols, boxes, passes=passes, cages=cages)
+    except _Contradiction:
+        return 0
+    found = []
+    propagating_search(candidates, grid, rows, cols, boxes, found, limit, passes, cages=cages)
+    return len(found)
 
 
-def backtracking(puzzle) -> bool:
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            exit()
-        if event.type == pygame.KEYDOWN:
-            if event.key == pygame.K_ESCAPE:
-                exit()
+def propagating_search(candidates, grid, rows, cols, boxes, found, limit, passes=(), monitor=None, stats=None,
+                       trace=None, cages=None) -> None:
+    """
+    Search the solutions by branching on the empty cell with the fewest candidates
+    and propagating every guess. The grid is copied for each guess, so nothing has
+    to be undone.
+    :param candidates: Candidate masks which have been propagated.
+    :param found: List where the solved grids are appended.
+    :param limit: Stop when `found` has this many grids.
+    :param passes: List of (name, function) tuples of the elimination passes to propagate with.
+    :param trace: Optional trace where the steps are appended, see `solve`. The cells
+        filled in a failed branch are undone one by one.
+    :param cages: Optional `Cages` to propagate with.
+    """
+    if monitor is not None:
+        monitor()
+    if stats is not None:
+        stats.nodes += 1
+    selected = None
+    fewest = 10
+    for k, mask in enumerate(candidates):
+        if mask is not None and BIT_COUNT[mask] < fewest:
+            selected = k
+            fewest = BIT_COUNT[mask]
+            if fewest == 2:
+                break
+    if selected is None:
+        found.append(grid)
+        return
 
-    empty_cell = check_if_empty(puzzle)
-    if empty_cell:
-        row, col = empty_cell
-        # print(f"row: {row}, col: {col}")
-    else:
+    before = len(found)
+    for value in MASK_DIGITS[candidates[selected]]:
+        branch = (candidates.copy(), grid.copy(), rows.copy(), cols.copy(), boxes.copy())
+        queue = []
+        if trace is not None:
+            trace.append(trace_step(TRACE_GUESS, selected, value))
+        try:
+            assign(*branch, queue, selected, value)
+            propagate(*branch, queue, stats=stats, passes=passes, trace=trace, cages=cages)
+        except _Contradiction:
+            if trace is not None:
+                _undo_branch(trace, grid, branch[1], selected)
+            continue
+        propagating_search(*branch, found, limit, passes, monitor, stats, trace, cages)
+        if len(found) >= limit:
+            return
+        if trace is not None:
+            _undo_branch(trace, grid, branch[1], selected)
+    if stats is not None and len(found) == before:
+        stats.dead_ends += 1
+
+
+def _undo_branch(trace, grid, branch_grid, selected) -> None:
+    """
+    Record the removal of the values a failed branch filled, the guess in cell `selected` last.
+    """
+    for k in range(len(grid)):
+        if branch_grid[k] and not grid[k] and k != selected:
+            trace.append(trace_step(TRACE_UNDO, k, branch_grid[k]))
+    trace.append(trace_step(TRACE_UNDO, selected, branch_grid[selected]))
+
+
+def init_masks(grid):
+    """
+    Build the bitmasks of digits already used in each row, column and 3x3 square.
+    :param grid: Flattened puzzle of 81 values, 0 marking an empty cell.
+    :return: Tuple (rows, cols, boxes) of lists of 9 masks, or None if a digit
+        is repeated in some unit and the puzzle can not be solved.
+    """
+    rows = [0] * 9
+    cols = [0] * 9
+    boxes = [0] * 9
+    for k, value in enumerate(grid):
+        if value:
+            bit = DIGIT_BIT[value]
+            row, col, box = CELL_ROW[k], CELL_COL[k], CELL_BOX[k]
+            if (rows[row] | cols[col] | boxes[box]) & bit:
+                return None
+            rows[row] |= bit
+            cols[col] |= bit
+            boxes[box] |= bit
+    return rows, cols, boxes
+
+
+def place(grid, rows, cols, boxes, k, value) -> None:
+    bit = DIGIT_BIT[value]
+    grid[k] = value
+    rows[CELL_ROW[k]] |= bit
+    cols[CELL_COL[k]] |= bit
+    boxes[CELL_BOX[k]] |= bit
+
+
+def remove(grid, rows, cols, boxes, k) -> None:
+    bit = ~DIGIT_BIT[grid[k]]
+    grid[k] = 0
+    rows[CELL_ROW[k]] &= bit
+    cols[CELL_COL[k]] &= bit
+    boxes[CELL_BOX[k]] &= bit
+
+
+def get_candidates(grid, rows, cols, boxes) -> list:
+    """
+    Calculate the candidate mask of every cell. Filled cells get None so that
+    they are skipped the same way as in `get_possible_values`.
+    """
+    return [None if grid[k] else ALL_DIGITS & ~(rows[CELL_ROW[k]] | cols[CELL_COL[k]] | boxes[CELL_BOX[k]])
+            for k in range(81)]
+
+
+def propagate(candidates, grid, rows, cols, boxes, queue=None, stats=None, passes=(), trace=None,
+              cages=None) -> None:
+    """
+    Fill every cell which is forced by the singles rules. Only the peers of the placed
+    cells are updated, and each pass fills every single it finds instead of the first one.
+    When the singles rules are stuck the elimination `passes` are tried in order until
+    one of them removes candidates, and the singles rules are tried again. The `cages`
+    are filtered before the passes.
+    :param candidates: Candidate masks from `get_candidates`, kept up to date in place.
+    :param queue: Cells which have been filled but whose value has not yet been removed
+        from the candidates of their peers. If None, the candidates are assumed to be
+        up to date and every cell with a single candidate is filled first.
+    :param stats: Optional `SolveStats` where the passes and the filled cells are counted.
+    :param passes: List of (name, function) tuples of the elimination passes from `PASSES`.
+    :param trace: Optional trace where the filled cells are appended, see `solve`.
+    :param cages: Optional `Cages` of a killer sudoku.
+    :raises _Contradiction: If some cell has no candidates left, some digit has no
+        place left in a unit or no digits fit some cage.
+    """
+    singles = []
+    if queue is None:
+        queue = []
+        for k, mask in enumerate(candidates):
+            if mask is not None:
+                if not mask:
+                    raise _Contradiction
+                if BIT_COUNT[mask] == 1:
+                    singles.append(k)
+
+    while True:
+        singles.extend(eliminate(candidates, grid, queue))
+
+        if stats is not None:
+            stats.propagation_passes += 1
+
+        # Fill unique values
+        if trace is None:
+            filled = fill_unique(candidates, grid, rows, cols, boxes, queue, singles)
+        else:
+            filled = _traced(fill_unique, TRACE_UNIQUE, trace, candidates, grid, rows, cols, boxes, queue, singles)
+        singles = []
+        if filled:
+            if stats is not None:
+                stats.filled["unique"] += filled
+            continue
+
+        # Check if possible value appears once in a 3x3 square, a row or a column
+        if trace is None:
+            square = fill_square(candidates, grid, rows, cols, boxes, queue)
+            row = fill_row(candidates, grid, rows, cols, boxes, queue)
+            col = fill_col(candidates, grid, rows, cols, boxes, queue)
+        else:
+            square = _traced(fill_square, TRACE_SQUARE, trace, candidates, grid, rows, cols, boxes, queue)
+            row = _traced(fill_row, TRACE_ROW, trace, candidates, grid, rows, cols, boxes, queue)
+            col = _traced(fill_col, TRACE_COL, trace, candidates, grid, rows, cols, boxes, queue)
+        if stats is not None:
+            stats.filled["square"] += square
+            stats.filled["row"] += row
+            stats.filled["col"] += col
+        if square + row + col:
+            continue
+
+        if cages is not None:
+            eliminated = cages.filter(candidates, grid)
+            if eliminated:
+                if stats is not None:
+                    stats.eliminated["cages"] = stats.eliminated.get("cages", 0) + eliminated
+                singles = [k for k, mask in enumerate(candidates) if mask is not None and BIT_COUNT[mask] == 1]
+                continue
+
+        for name, eliminate_pass in passes:
+            eliminated = eliminate_pass(candidates)
+            if eliminated:
+                if stats is not None:
+                    stats.eliminated[name] = stats.eliminated.get(name, 0) + eliminated
+                singles = [k for k, mask in enumerate(candidates) if mask is not None and BIT_COUNT[mask] == 1]
+                break
+        else:
+            break
+
+
+def assign(candidates, grid, rows, cols, boxes, queue, k, value) -> None:
+    """
+    Fill cell `k` with `value` and add it to the `queue` of cells to propagate.
+    :raises _Contradiction: If the value has already been used by a peer. This happens
+        when two singles found from the same candidates need the same digit.
+    """
+    bit = DIGIT_BIT[value]
+    if (rows[CELL_ROW[k]] | cols[CELL_COL[k]] | boxes[CELL_BOX[k]]) & bit:
+        raise _Contradiction
+    place(grid, rows, cols, boxes, k, value)
+    candidates[k] = None
+    queue.append(k)
+
+
+def eliminate(candidates, grid, queue) -> list:
+    """
+    Remove the values of the queued cells from the candidates of their peers.
+    :return: List of the peers which were left with a single candidate.
+    :raises _Contradiction: If some peer has no candidates left.
+    """
+    singles = []
+    while queue:
+        k = queue.pop()
+        bit = DIGIT_BIT[grid[k]]
+        for p in PEERS[k]:
+            mask = candidates[p]
+            if mask is not None and mask & bit:
+                mask &= ~bit
+                if not mask:
+                    raise _Contradiction
+                candidates[p] = mask
+                if BIT_COUNT[mask] == 1:
+                    singles.append(p)
+    return singles
+
+
+def fill_unique(candidates, grid, rows, cols, boxes, queue, singles) -> int:
+    """
+    Fill the `singles`, the cells with only one possible value.
+    :return: Number of cells filled.
+    """
+    filled = 0
+    for k in singles:
+        mask = candidates[k]
+        if mask is not None:
+            assign(candidates, grid, rows, cols, boxes, queue, k, MASK_DIGITS[mask][0])
+            filled += 1
+    return filled
+
+
+def fill_hidden(candidates, grid, rows, cols, boxes, queue, units, used) -> int:
+    """
+    Fill every cell which is the only place for some digit in one of the `units`.
+    :param units: List of the cell lists of the units.
+    :param used: Masks of the digits already placed in each of the `units`.
+    :return: Number of cells filled.
+    :raises _Contradiction: If some digit has no place left in a unit or a cell
+        is the only place for two digits.
+    """
+    filled = 0
+    for unit, unit_used in zip(units, used):
+        once = 0
+        twice = 0
+        for k in unit:
+            mask = candidates[k]
+            if mask is not None:
+                twice |= once & mask
+                once |= mask
+        if (once | unit_used) != ALL_DIGITS:
+            raise _Contradiction
+        # Candidates can still contain digits placed earlier in this pass
+        hidden = once & ~twice & ~unit_used
+        if hidden:
+            for k in unit:
+                mask = candidates[k]
+                if mask is not None and mask & hidden:
+                    if BIT_COUNT[mask & hidden] > 1:
+                        raise _Contradiction
+                    assign(candidates, grid, rows, cols, boxes, queue, k, MASK_DIGITS[mask & hidden][0])
+                    filled += 1
+    return filled
+
+
+def fill_row(candidates, grid, rows, cols, boxes, queue) -> int:
+    return fill_hidden(candidates, grid, rows, cols, boxes, queue, ROW_CELLS, rows)
+
+
+def fill_col(candidates, grid, rows, cols, boxes, queue) -> int:
+    return fill_hidden(candidates, grid, rows, cols, boxes, queue, COL_CELLS, cols)
+
+
+def fill_square(candidates, grid, rows, cols, boxes, queue) -> int:
+    return fill_hidden(candidates, grid, rows, cols, boxes, queue, BOX_CELLS, boxes)
+
+
+def remove_candidates(candidates, cells, bits) -> int:
+    """
+    Remove the digits in the mask `bits` from the candidates of the `cells`.
+    :return: Number of candidates removed.
+    :raises _Contradiction: If some cell has no candidates left.
+    """
+    removed = 0
+    for k in cells:
+        mask = candidates[k]
+        if mask and mask & bits:
+            removed += BIT_COUNT[mask & bits]
+            mask &= ~bits
+            if not mask:
+                raise _Contradiction
+            candidates[k] = mask
+    return removed
+
+
+def locked_candidates(candidates) -> int:
+    """
+    Pointing and claiming: if the candidates of a digit in a 3x3 square all lie in
+    one row or column, the digit is removed from the rest of that line, and if they
+    all lie in one square in a row or column, from the rest of that square.
+    :return: Number of candidates removed.
+    """
+    removed = 0
+    for segment, line_rest, box_rest in SEGMENTS:
+        inside = 0
+        for k in segment:
+            inside |= candidates[k] or 0
+        if not inside:
+            continue
+        line_other = 0
+        for k in line_rest:
+            line_other |= candidates[k] or 0
+        box_other = 0
+        for k in box_rest:
+            box_other |= candidates[k] or 0
+        pointing = inside & line_other & ~box_other
+        if pointing:
+            removed += remove_candidates(candidates, line_rest, pointing)
+        claiming = inside & box_other & ~line_other
+        if claiming:
+            removed += remove_candidates(candidates, box_rest, claiming)
+    return removed
+
+
+def naked_subsets(candidates, size) -> int:
+    """
+    If `size` cells of a unit have only `size` candidates between them, those digits
+    are removed from the other cells of the unit.
+    :return: Number of candidates removed.
+    :raises _Contradiction: If `size` cells of a unit have fewer candidates between them.
+    """
+    removed = 0
+    for unit in UNITS:
+        cells = [k for k in unit if candidates[k] is not None and BIT_COUNT[candidates[k]] <= size]
+        for subset in itertools.combinations(cells, size):
+            digits = 0
+            for k in subset:
+                digits |= candidates[k]
+            if BIT_COUNT[digits] < size:
+                raise _Contradiction
+            if BIT_COUNT[digits] == size:
+                removed += remove_candidates(candidates, [k for k in unit if k not in subset], digits)
+    return removed
+
+
+def hidden_subsets(candidates, size) -> int:
+    """
+    If `size` digits can only be placed in the same `size` cells of a unit, the other
+    candidates are removed from those cells.
+    :return: Number of candidates removed.
+    :raises _Contradiction: If `size` digits of a unit have fewer places between them.
+    """
+    removed = 0
+    for unit in UNITS:
+        # Places of each digit in the unit as a mask of the unit's cell indexes
+        places = [0] * 10
+        for i, k in enumerate(unit):
+            for digit in MASK_DIGITS[candidates[k] or 0]:
+                places[digit] |= 1 << i
+        digits = [digit for digit in range(1, 10) if 2 <= BIT_COUNT[places[digit]] <= size]
+        for subset in itertools.combinations(digits, size):
+            cells = 0
+            keep = 0
+            for digit in subset:
+                cells |= places[digit]
+                keep |= DIGIT_BIT[digit]
+            if BIT_COUNT[cells] < size:
+                raise _Contradiction
+            if BIT_COUNT[cells] == size:
+                for i in MASK_DIGITS[cells]:
+                    k = unit[i - 1]
+                    extra = candidates[k] & ~keep
+                    if extra:
+                        candidates[k] &= keep
+                        removed += BIT_COUNT[extra]
+    return removed
+
+
+def fish(candidates, size) -> int:
+    """
+    X-Wing for `size` 2 and Swordfish for 3: if the candidates of a digit in `size`
+    rows all lie in the same `size` columns, the digit is removed from those columns
+    in the other rows, and the same with rows and columns swapped.
+    :return: Number of candidates removed.
+    """
+    removed = 0
+    for digit in range(1, 10):
+        bit = DIGIT_BIT[digit]
+        for lines, crosses in ((ROW_CELLS, COL_CELLS), (COL_CELLS, ROW_CELLS)):
+            # Places of the digit in each line as a mask of the crossing line indexes
+            places = []
+            for line in lines:
+                mask = 0
+                for i, k in enumerate(line):
+                    if (candidates[k] or 0) & bit:
+                        mask |= 1 << i
+                places.append(mask)
+            base = [n for n in range(9) if 2 <= BIT_COUNT[places[n]] <= size]
+            for subset in itertools.combinations(base, size):
+                cover = 0
+                for n in subset:
+                    cover |= places[n]
+                if BIT_COUNT[cover] == size:
+                    for i in MASK_DIGITS[cover]:
+                        cross = crosses[i - 1]
+                        removed += remove_candidates(candidates, [cross[n] for n in range(9) if n not in subset],
+                                                     bit)
+    return removed
+
+
+def naked_pairs(candidates) -> int:
+    return naked_subsets(candidates, 2)
+
+
+def naked_triples(candidates) -> int:
+    return naked_subsets(candidates, 3)
+
+
+def hidden_pairs(candidates) -> int:
+    return hidden_subsets(candidates, 2)
+
+
+def hidden_triples(candidates) -> int:
+    return hidden_subsets(candidates, 3)
+
+
+def x_wing(candidates) -> int:
+    return fish(candidates, 2)
+
+
+def swordfish(candidates) -> int:
+    return fish(candidates, 3)
+
+
+# Elimination passes from the cheapest to the most expensive. Each pass removes
+# candidates which can not be in the solution and returns how many it removed.
+PASSES = {"locked": locked_candidates,
+          "naked_pairs": naked_pairs,
+          "hidden_pairs": hidden_pairs,
+          "naked_triples": naked_triples,
+          "hidden_triples": hidden_triples,
+          "x_wing": x_wing,
+          "swordfish": swordfish,
+          }
+
+
+def _cage_combinations() -> list:
+    table = [[[] for total in range(46)] for n in range(10)]
+    for mask in range(ALL_DIGITS + 1):
+        table[BIT_COUNT[mask]][sum(MASK_DIGITS[mask])].append(mask)
+    return table
+
+
+# Masks of the sets of different digits by their count and sum: CAGE_COMBINATIONS[n][total]
+# lists every way to fill n cells of a cage so that they add up to total
+CAGE_COMBINATIONS = _cage_combinations()
+
+
+class Cages:
+    """
+    The cages of a killer sudoku: groups of cells whose digits are all different and
+    add up to the sum of the cage. The candidates of a cage are filtered with the
+    digit combinations in `CAGE_COMBINATIONS`, so the sums are never searched.
+    """
+    def __init__(self, cages):
+        """
+        :param cages: Iterable of (cells, total) pairs, the cells as (row, col) pairs
+            of a 9x9 board. A cell can be in at most one cage, and the cells outside
+            the cages are not constrained.
+        :raises ValueError: If a cell is outside the board or in two cages, or no
+            combination of digits fits the size and the sum of a cage.
+        """
+        self.cages = []
+        used = set()
+        for cells, total in cages:
+            cells = [tuple(cell) for cell in cells]
+            for row, col in cells:
+                if not (0 <= row < 9 and 0 <= col < 9):
+                    raise ValueError(f"Cage cell {(row, col)} is outside the board")
+            indexes = [9 * row + col for row, col in cells]
+            if used.intersection(indexes) or len(set(indexes)) != len(indexes):
+                raise ValueError(f"Cage cells {cells} overlap another cage")
+            used.update(indexes)
+            if not 1 <= len(cells) <= 9 or not 0 <= total <= 45 or not CAGE_COMBINATIONS[len(cells)][total]:
+                raise ValueError(f"No digits fit a cage of {len(cells)} cells with the sum {total}")
+            self.cages.append((indexes, total))
+
+    def __len__(self):
+        return len(self.cages)
+
+    def to_list(self) -> list:
+        """
+        :return: The cages as lists [[[row, col], ...], total], which can be given back
+            to the constructor and stored as JSON.
+        """
+        return [[[[CELL_ROW[k], CELL_COL[k]] for k in cells], total] for cells, total in self.cages]
+
+    def filter(self, candidates, grid) -> int:
+        """
+        Keep only the candidates which are part of some combination still fitting each
+        cage: a combination has the size and the remaining sum of the empty cells of the
+        cage, none of the digits already placed in it and only digits which are still
+        candidates of those cells.
+        :param candidates: Candidate masks from `get_candidates`, updated in place.
+        :return: Number of candidates removed.
+        :raises _Contradiction: If a digit is repeated in a cage or no combination fits it.
+        """
+        removed = 0
+        for cells, total in self.cages:
+            placed = 0
+            remaining = total
+            empty = []
+            possible = 0
+            for k in cells:
+                value = grid[k]
+                if value:
+                    bit = DIGIT_BIT[value]
+                    if placed & bit:
+                        raise _Contradiction
+                    placed |= bit
+                    remaining -= value
+                else:
+                    empty.append(k)
+                    possible |= candidates[k]
+            if not empty:
+                if remaining:
+                    raise _Contradiction
+                continue
+            if remaining <= 0:
+                raise _Contradiction
+            allowed = 0
+            for combination in CAGE_COMBINATIONS[len(empty)][remaining]:
+                if not combination & placed and combination & possible == combination:
+                    allowed |= combination
+            if not allowed:
+                raise _Contradiction
+            removed += remove_candidates(candidates, empty, ALL_DIGITS & ~allowed)
+        return removed
+
+
+def backtracking(grid, rows, cols, boxes, monitor=None, select_cell=None, order_values=None, stats=None,
+                 trace=None) -> bool:
+    if monitor is not None:
+        monitor()
+    if stats is not None:
+        stats.nodes += 1
+
+    selected = (select_cell or select_first_empty)(grid, rows, cols, boxes)
+    if selected is None:
         return True
-    for k in range(1, 10):
-        if is_possible(puzzle, k, row, col)[0]:
-            puzzle[row][col] = k
-            # for row_temp in puzzle:
-            #     print(row_temp)
-            # print()
-            if backtracking(puzzle):
-                return True
-            # print(f"row2: {row}, col2: {col}")
-            puzzle[row][col] = 0
+    k, mask = selected
+    for value in (order_values or ascending_values)(grid, rows, cols, boxes, k, mask):
+        place(grid, rows, cols, boxes, k, value)
+        if trace is not None:
+            trace.append(trace_step(TRACE_GUESS, k, value))
+        if backtracking(grid, rows, cols, boxes, monitor, select_cell, order_values, stats, trace):
+            return True
+        remove(grid, rows, cols, boxes, k)
+        if trace is not None:
+            trace.append(trace_step(TRACE_UNDO, k, value))
 
+    if stats is not None:
+        stats.dead_ends += 1
     return False
 
 
+def select_first_empty(grid, rows, cols, boxes):
+    """
+    Select the first empty cell in row-major order.
+    :return: Tuple (cell, candidate mask), or None if the grid is full.
+    """
+    try:
+        k = grid.index(0)
+    except ValueError:
+        return None
+    return k, ALL_DIGITS & ~(rows[CELL_ROW[k]] | cols[CELL_COL[k]] | boxes[CELL_BOX[k]])
+
+
+def select_most_constrained(grid, rows, cols, boxes):
+    """
+    Select the empty cell with the fewest candidates (minimum remaining values).
+    A cell without candidates is returned at once so that the branch fails immediately.
+    :return: Tuple (cell, candidate mask), or None if the grid is full.
+    """
+    selected = None
+    fewest = 10
+    for k in range(81):
+        if not grid[k]:
+            mask = ALL_DIGITS & ~(rows[CELL_ROW[k]] | cols[CELL_COL[k]] | boxes[CELL_BOX[k]])
+            if BIT_COUNT[mask] < fewest:
+                selected = (k, mask)
+                fewest = BIT_COUNT[mask]
+                if fewest <= 1:
+                    break
+    return selected
+
+
+def ascending_values(grid, rows, cols, boxes, k, mask):
+    return MASK_DIGITS[mask]
+
+
+def least_constraining_values(grid, rows, cols, boxes, k, mask):
+    """
+    Order the candidates of cell `k` so that the value which appears as a candidate
+    in the fewest empty peers comes first.
+    """
+    digits = MASK_DIGITS[mask]
+    if len(digits) < 2:
+        return digits
+    peer_masks = [ALL_DIGITS & ~(rows[CELL_ROW[p]] | cols[CELL_COL[p]] | boxes[CELL_BOX[p]])
+                  for p in PEERS[k] if not grid[p]]
+    return sorted(digits, key=lambda d: sum(1 for m in peer_masks if m & DIGIT_BIT[d]))
+
+
+STRATEGIES = {"first": select_first_empty, "mrv": select_most_constrained}
+VALUE_ORDERS = {"ascending": ascending_values, "lcv": least_constraining_values}
+
+
+class Geometry:
+    """
+    Tables of the cells, units and peers of a board of `size` x `size` cells, used to
+    solve the boards other than 9x9. The 9x9 engine uses the module level tables,
+    which are faster to look up. Use `get_geometry` to share the tables of a size.
+    """
+    def __init__(self, size):
+        if size not in SIZES:
+            raise ValueError(f"Unsupported board size: {size}")
+        box = math.isqrt(size)
+        self.size = size
+        self.box = box
+        self.cells = size * size
+        self.all_digits = (1 << size) - 1
+        cell_row = [k // size for k in range(self.cells)]
+        cell_col = [k % size for k in range(self.cells)]
+        cell_box = [(k // (size * box)) * box + (k % size) // box for k in range(self.cells)]
+        rows = [[k for k in range(self.cells) if cell_row[k] == i] for i in range(size)]
+        cols = [[k for k in range(self.cells) if cell_col[k] == i] for i in range(size)]
+        boxes = [[k for k in range(self.cells) if cell_box[k] == i] for i in range(size)]
+        self.units = rows + cols + boxes
+        # Kind of the trace step of a hidden single found in each unit
+        self.unit_kinds = [TRACE_ROW] * size + [TRACE_COL] * size + [TRACE_SQUARE] * size
+        # Indices of the row, the column and the square of each cell in `units`
+        self.cell_units = [(cell_row[k], size + cell_col[k], 2 * size + cell_box[k]) for k in range(self.cells)]
+        self.peers = [sorted(set(rows[cell_row[k]] + cols[cell_col[k]] + boxes[cell_box[k]]) - {k})
+                      for k in range(self.cells)]
+
+
+_geometries = {}
+
+
+def get_geometry(size) -> Geometry:
+    geometry = _geometries.get(size)
+    if geometry is None:
+        geometry = _geometries[size] = Geometry(size)
+    return geometry
+
+
+def _solve_nxn(puzzle, monitor, stats, trace):
+    if stats is not None:
+        start = time.perf_counter()
+    size = len(puzzle)
+    found = _search_nxn_puzzle(puzzle, 1, monitor, stats, trace)
+    if stats is not None:
+        stats.times["search"] = time.perf_counter() - start
+    if not found:
+        return None
+    return [found[0][size * i:size * i + size] for i in range(size)]
+
+
+def _search_nxn_puzzle(puzzle, limit, monitor=None, stats=None, trace=None) -> list:
+    """
+    Search at most `limit` solutions of a board of any size in `SIZES`.
+    :return: List of the solved grids as flat lists of values.
+    """
+    geometry = get_geometry(len(puzzle))
+    grid = [value for row in puzzle for value in row]
+    if any(len(row) != geometry.size for row in puzzle) or max(grid, default=0) > geometry.size:
+        raise ValueError(f"Invalid {geometry.size}x{geometry.size} puzzle")
+    # Digits used in each unit, and the candidates of the empty cells
+    used = [0] * len(geometry.units)
+    queue = []
+    for k, value in enumerate(grid):
+        if value:
+            bit = 1 << (value - 1)
+            for unit in geometry.cell_units[k]:
+                if used[unit] & bit:
+                    return []
+                used[unit] |= bit
+            queue.append(k)
+    candidates = [None if value else geometry.all_digits for value in grid]
+    found = []
+    try:
+        _propagate_nxn(geometry, candidates, grid, used, queue, stats, trace)
+    except _Contradiction:
+        return found
+    if monitor is not None:
+        monitor.check()
+    _search_nxn(geometry, candidates, grid, used, found, limit, monitor, stats, trace)
+    return found
+
+
+def _assign_nxn(geometry, candidates, grid, used, queue, k, value, kind, stats, trace) -> None:
+    """
+    Fill cell `k` of a board of any size and add it to the `queue` of cells to propagate.
+    :param kind: Kind of the trace step which filled the cell.
+    :raises _Contradiction: If the value has already been used in a unit of the cell.
+    """
+    bit = 1 << (value - 1)
+    units = geometry.cell_units[k]
+    for unit in units:
+        if used[unit] & bit:
+            raise _Contradiction
+    for unit in units:
+        used[unit] |= bit
+    grid[k] = value
+    candidates[k] = None
+    queue.append(k)
+    if stats is not None and kind != TRACE_GUESS:
+        stats.filled[TRACE_KINDS[kind]] += 1
+    if trace is not None:
+        trace.append(trace_step(kind, k, value))
+
+
+def _propagate_nxn(geometry, candidates, grid, used, queue, stats=None, trace=None) -> None:
+    """
+    Remove the values of the queued cells from their peers, filling the cells left with
+    a single candidate, and fill the hidden singles until neither rule fills a cell.
+    :raises _Contradiction: If some cell has no candidates left or some digit has no
+        place left in a unit.
+    """
+    peers = geometry.peers
+    all_digits = geometry.all_digits
+    while True:
+        if stats is not None:
+            stats.propagation_passes += 1
+        while queue:
+            k = queue.pop()
+            bit = 1 << (grid[k] - 1)
+            for p in peers[k]:
+                mask = candidates[p]
+                if mask is not None and mask & bit:
+                    mask &= ~bit
+                    if not mask:
+                        raise _Contradiction
+                    candidates[p] = mask
+                    if not mask & (mask - 1):
+                        _assign_nxn(geometry, candidates, grid, used, queue, p, mask.bit_length(), TRACE_UNIQUE,
+                                    stats, trace)
+
+        # Candidates can still contain digits placed earlier in this pass, placing
+        # them again raises a contradiction in `_assign_nxn`
+        filled = 0
+        for u, unit in enumerate(geometry.units):
+            once = 0
+            twice = 0
+            for k in unit:
+                mask = candidates[k]
+                if mask is not None:
+                    twice |= once & mask
+                    once |= mask
+            if (once | used[u]) != all_digits:
+                raise _Contradiction
+            hidden = once & ~twice & ~used[u]
+            while hidden:
+                bit = hidden & -hidden
+                hidden ^= bit
+                for k in unit:
+                    mask = candidates[k]
+                    if mask is not None and mask & bit:
+                        _assign_nxn(geometry, candidates, grid, used, queue, k, bit.bit_length(),
+                                    geometry.unit_kinds[u], stats, trace)
+                        filled += 1
+                        break
+        if not filled:
+            return
+
+
+def _search_nxn(geometry, candidates, grid, used, found, limit, monitor=None, stats=None, trace=None) -> None:
+    """
+    Search the solutions of a propagated board of any size by branching on the empty
+    cell with the fewest candidates, like `propagating_search`.
+    """
+    if monitor is not None:
+        monitor()
+    if stats is not None:
+        stats.nodes += 1
+    selected = None
+    fewest = geometry.size + 1
+    for k, mask in enumerate(candidates):
+        if mask is not None:
+            count = bin(mask).count("1")
+            if count < fewest:
+                selected = k
+                fewest = count
+                if count == 2:
+                    break
+    if selected is None:
+        found.append(grid)
+        return
+
+    before = len(found)
+    mask = candidates[selected]
+    while mask:
+        bit = mask & -mask
+        mask ^= bit
+        branch = (candidates.copy(), grid.copy(), used.copy())
+        try:
+            queue = []
+            _assign_nxn(geometry, *branch, queue, selected, bit.bit_length(), TRACE_GUESS, stats, trace)
+            _propagate_nxn(geometry, *branch, queue, stats, trace)
+        except _Contradiction:
+            if trace is not None:
+                _undo_branch(trace, grid, branch[1], selected)
+            continue
+        _search_nxn(geometry, *branch, found, limit, monitor, stats, trace)
+        if len(found) >= limit:
+            return
+        if trace is not None:
+            _undo_branch(trace, grid, branch[1], selected)
+    if stats is not None and len(found) == before:
+        stats.dead_ends += 1
+
+
 def is_possible(puzzle, value, row, col) -> (bool, list):
     """
     Check if the given `value` is viable to be put into the cell located to `row` and `col`
@@ -144,7 +1239,7 @@ def is_possible(puzzle, value, row, col) -> (bool, list):
     :param row: The row where the `value` is put
     :param col: The column where the `value` is put
     :return: Return a tuple of length 2 of the form (bool, list). Bool is False if the `value`
-        is already found in the `row`, `col` or 3x3 square where the value would be placed.
+        is already found in the `row`, `col` or square where the value would be placed.
         In this case the list contains every location where duplicate was found.
         Otherwise it is possible to place the value into the cell.
         In this case return True with empty list.
@@ -157,17 +1252,19 @@ def is_possible(puzzle, value, row, col) -> (bool, list):
     # is no need for change).
     # The empty cell corresponds to value 0 or None, so the function returns True for
     # numbers 1-9
-    for i in range(9):
+    size = len(puzzle)
+    box = math.isqrt(size)
+    for i in range(size):
         if puzzle[row][i] == value:
             errors.append((row, i))
             # return False
         if puzzle[i][col] == value:
             errors.append((i, col))
             # return False
-    x = row // 3
-    y = col // 3
-    for i in range(3 * x, 3 * x + 3):
-        for j in range(3 * y, 3 * y + 3):
+    x = row // box
+    y = col // box
+    for i in range(box * x, box * x + box):
+        for j in range(box * y, box * y + box):
             if puzzle[i][j] == value:
                 errors.append((i, j))
                 # return False
@@ -175,44 +1272,58 @@ def is_possible(puzzle, value, row, col) -> (bool, list):
 
 
 def check_if_empty(puzzle):
-    for i in range(9):
-        for j in range(9):
+    for i in range(len(puzzle)):
+        for j in range(len(puzzle)):
             if puzzle[i][j] == 0:
                 return i, j
 
 
 def get_possible_values(puzzle, row, col):
+    if len(puzzle) != 9:
+        return _get_possible_values_nxn(puzzle, row, col)
     if not puzzle[row][col]:
-        number_set = {1, 2, 3, 4, 5, 6, 7, 8, 9}
-        # Check rows
+        used = 0
         for j in range(9):
-            number_set.discard(puzzle[row][j])
-        # Check columns
+            used |= DIGIT_BIT[puzzle[row][j]]
         for i in range(9):
-            number_set.discard(puzzle[i][col])
-        # Check 3x3 square
+            used |= DIGIT_BIT[puzzle[i][col]]
         x = row // 3
         y = col // 3
         for i in range(3*x, 3*x + 3):
             for j in range(3*y, 3*y + 3):
-                number_set.discard(puzzle[i][j])
-        # if not number_set:
-        #     print("Impossible puzzle")
-        return number_set
+                used |= DIGIT_BIT[puzzle[i][j]]
+        return set(MASK_DIGITS[ALL_DIGITS & ~used])
     return None
 
 
+def _get_possible_values_nxn(puzzle, row, col):
+    if puzzle[row][col]:
+        return None
+    size = len(puzzle)
+    box = math.isqrt(size)
+    number_set = set(range(1, size + 1))
+    number_set.difference_update(puzzle[row])
+    number_set.difference_update(puzzle[i][col] for i in range(size))
+    x = row // box * box
+    y = col // box * box
+    for i in range(x, x + box):
+        number_set.difference_update(puzzle[i][y:y + box])
+    return number_set
+
+
 def check_solution(puzzle) -> bool:
     """
-    Check that each row, column and 3x3 square of the sudoku puzzle has every number
-    between 1-9 once.
+    Check that each row, column and square of the sudoku puzzle has every number
+    between 1 and the size of the board once.
     :param puzzle: List containing the lists of values of the each row.
-    :return: Return True if each row, column and 3x3 square contain each of the numbers
-    between 1-9 once. Return False otherwise
+    :return: Return True if each row, column and square contain each of the numbers
+    once. Return False otherwise
     """
-    numbers = {1, 2, 3, 4, 5, 6, 7, 8, 9}
+    size = len(puzzle)
+    box = math.isqrt(size)
+    numbers = set(range(1, size + 1))
     is_correct = True
-    for i in range(9):
+    for i in range(size):
         # collect set of all values from the i:th row of the puzzle
         row = set(puzzle[i])
         # check if the row contains every number once
@@ -222,21 +1333,19 @@ def check_solution(puzzle) -> bool:
 
         # collect set of all values from the i:th column of the puzzle
         col = set()
-        for j in range(9):
+        for j in range(size):
             col.add(puzzle[j][i])
         # check if the column contains every number once
         if col != numbers:
             is_correct = False
             break
 
-        # collect set of all values from the 3x3 square
+        # collect set of all values from the i:th square
         square = set()
-        for j in range(9):
-            x = i // 3
-            y = j // 3
-            for i2 in range(3 * x, 3 * x + 3):
-                for j2 in range(3 * y, 3 * y + 3):
-                    square.add(puzzle[i2][j2])
+        x = i // box * box
+        y = i % box * box
+        for i2 in range(x, x + box):
+            square.update(puzzle[i2][y:y + box])
         # check if the square contains every number once
         if square != numbers:
             is_correct = False
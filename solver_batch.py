@@ -0,0 +1,111 @@
+import numpy as np
+
+import solver
+
+# Values of the status vector returned by `solve_batch`
+UNSOLVABLE = 0
+SOLVED = 1
+SOLVED_BY_SEARCH = 2
+_PENDING = 255
+
+# Puzzles are propagated in chunks to bound the size of the temporary arrays
+CHUNK_SIZE = 65536
+
+# Cell indices of the 27 units (rows, columns and 3x3 squares) and the three units of each cell
+UNITS = np.array(solver.ROW_CELLS + solver.COL_CELLS + solver.BOX_CELLS, dtype=np.intp)
+CELL_UNITS = np.array([[solver.CELL_ROW[k], 9 + solver.CELL_COL[k], 18 + solver.CELL_BOX[k]] for k in range(81)],
+                      dtype=np.intp)
+DIGIT_BIT = np.array(solver.DIGIT_BIT, dtype=np.uint16)
+BIT_COUNT = np.array(solver.BIT_COUNT, dtype=np.uint8)
+# Digit of a mask with a single candidate
+MASK_DIGIT = np.array([digits[0] if len(digits) == 1 else 0 for digits in solver.MASK_DIGITS], dtype=np.uint8)
+
+
+def solve_batch(puzzles, strategy="mrv", chunk_size=CHUNK_SIZE):
+    """
+    Solve an array of puzzles. The singles are propagated with vectorized operations
+    over the whole batch and only the puzzles which are still unsolved after that are
+    searched one by one with `solver.solve`.
+    :param puzzles: Array-like of shape (N, 9, 9) with values 0-9, 0 for empty cells.
+    :param strategy: Backtracking strategy passed to `solver.solve` for the searched puzzles.
+    :param chunk_size: Number of puzzles propagated at a time.
+    :return: Tuple (solutions, status). Solutions is an uint8 array of shape (N, 9, 9),
+        status an uint8 array of length N with values SOLVED, SOLVED_BY_SEARCH or
+        UNSOLVABLE. The rows of unsolvable puzzles contain the puzzle unchanged.
+    """
+    puzzles = np.asarray(puzzles)
+    if puzzles.ndim != 3 or puzzles.shape[1:] != (9, 9):
+        raise ValueError(f"Expected an array of shape (N, 9, 9), got {puzzles.shape}")
+    if puzzles.size and (puzzles.min() < 0 or puzzles.max() > 9):
+        raise ValueError("Puzzle values must be between 0 and 9")
+    puzzles = puzzles.astype(np.uint8).reshape(-1, 81)
+
+    solutions = puzzles.copy()
+    status = np.full(len(puzzles), _PENDING, dtype=np.uint8)
+    for start in range(0, len(puzzles), chunk_size):
+        _propagate(solutions[start:start + chunk_size], status[start:start + chunk_size])
+
+    for i in np.flatnonzero(status == _PENDING):
+        solution = solver.solve(solutions[i].reshape(9, 9).tolist(), strategy=strategy)
+        if solution is None:
+            status[i] = UNSOLVABLE
+        else:
+            solutions[i] = np.array(solution, dtype=np.uint8).reshape(81)
+            status[i] = SOLVED_BY_SEARCH
+
+    unsolvable = status == UNSOLVABLE
+    solutions[unsolvable] = puzzles[unsolvable]
+    return solutions.reshape(-1, 9, 9), status
+
+
+def _propagate(grids, status) -> None:
+    """
+    Fill the naked and hidden singles of the flattened `grids` in place until no
+    puzzle makes progress. Solved and contradictory puzzles are marked in `status`,
+    the others are left _PENDING.
+    """
+    active = np.arange(len(grids))
+    while active.size:
+        grid = grids[active]
+        empty = grid == 0
+
+        # Digits used in each unit. A unit with fewer distinct digits than filled
+        # cells has a duplicate.
+        used = np.bitwise_or.reduce(DIGIT_BIT[grid][:, UNITS], axis=2)
+        invalid = (BIT_COUNT[used] != (~empty)[:, UNITS].sum(axis=2)).any(axis=1)
+
+        candidates = ~np.bitwise_or.reduce(used[:, CELL_UNITS], axis=2) & solver.ALL_DIGITS
+        candidates[~empty] = 0
+        invalid |= (empty & (candidates == 0)).any(axis=1)
+        solved = ~empty.any(axis=1) & ~invalid
+
+        # Fill unique values
+        new = np.where(empty, MASK_DIGIT[candidates], 0)
+
+        # Digits which fit only one cell of a unit. A cell which is also a naked
+        # single gets the same digit from both rules.
+        hidden = np.flatnonzero(~invalid & ~solved)
+        if hidden.size:
+            unit_candidates = candidates[hidden][:, UNITS]
+            once = np.zeros(unit_candidates.shape[:2], dtype=np.uint16)
+            twice = np.zeros_like(once)
+            for i in range(9):
+                twice |= once & unit_candidates[:, :, i]
+                once |= unit_candidates[:, :, i]
+            unit_used = used[hidden]
+            invalid[hidden[((once | unit_used) != solver.ALL_DIGITS).any(axis=1)]] = True
+            single = once & ~twice & ~unit_used
+            for i in range(9):
+                cell_single = unit_candidates[:, :, i] & single
+                # A cell can not be the only place of two digits
+                invalid[hidden[(BIT_COUNT[cell_single] > 1).any(axis=1)]] = True
+                digit = MASK_DIGIT[cell_single]
+                puzzle, unit = np.nonzero(digit)
+                if puzzle.size:
+                    new[hidden[puzzle], UNITS[unit, i]] = digit[puzzle, unit]
+
+        # Conflicting singles are caught as duplicates or empty cells on the next pass
+        grids[active] = np.where(new > 0, new, grid)
+        status[active[solved]] = SOLVED
+        status[active[invalid]] = UNSOLVABLE
+        active = active[new.any(axis=1) & ~invalid & ~solved]
@@ -0,0 +1,149 @@
+# Exact cover backend for the solver (Knuth's Algorithm X).
+#
+# A sudoku is an exact cover problem with 324 constraint columns: every cell holds
+# one digit and every row, column and 3x3 square holds every digit once. Each of the
+# 729 choices "digit d in cell k" covers exactly four of these columns. Instead of
+# the pointer based dancing links the columns are kept in a dict of sets, which does
+# the same cover/uncover steps but is much faster in Python.
+
+# Column numbers of the four constraint groups
+CELL_COLUMNS = 0
+ROW_COLUMNS = 81
+COL_COLUMNS = 162
+BOX_COLUMNS = 243
+COLUMN_COUNT = 324
+
+# CHOICE_COLUMNS[k * 9 + d - 1] lists the columns covered by putting digit d into cell k
+CHOICE_COLUMNS = []
+for _k in range(81):
+    _row, _col = divmod(_k, 9)
+    _box = (_row // 3) * 3 + _col // 3
+    for _d in range(9):
+        CHOICE_COLUMNS.append((CELL_COLUMNS + _k,
+                               ROW_COLUMNS + _row * 9 + _d,
+                               COL_COLUMNS + _col * 9 + _d,
+                               BOX_COLUMNS + _box * 9 + _d))
+
+
+def _build_columns() -> dict:
+    columns = {c: set() for c in range(COLUMN_COUNT)}
+    for choice, covered in enumerate(CHOICE_COLUMNS):
+        for c in covered:
+            columns[c].add(choice)
+    return columns
+
+
+_COLUMNS = _build_columns()
+
+
+def solve_grid(grid, monitor=None):
+    """
+    Solve a flattened puzzle of 81 values with Algorithm X. If the puzzle has several
+    solutions, return the first one in row-major order, which is the same solution
+    the backtracking engine finds.
+    :param grid: List of 81 values in row-major order, 0 for empty cells. Not modified.
+    :param monitor: Optional callable which is called once per search node.
+    :return: Solved list of 81 values, or None if the puzzle has no solution.
+    """
+    solutions = find_solutions(grid, 2, monitor)
+    if not solutions:
+        return None
+    solution = solutions[0]
+    if len(solutions) == 1:
+        return solution
+
+    # Fix the cells one by one in row-major order to the smallest digit which
+    # still leads to a solution. Only digits smaller than the one in the current
+    # solution need to be tried.
+    fixed = list(grid)
+    for k in range(81):
+        if not fixed[k]:
+            for value in range(1, solution[k]):
+                fixed[k] = value
+                found = find_solutions(fixed, 1, monitor)
+                if found:
+                    solution = found[0]
+                    break
+            fixed[k] = solution[k]
+    return solution
+
+
+def find_solutions(grid, limit, monitor=None) -> list:
+    """
+    Search for at most `limit` solutions of a flattened puzzle of 81 values.
+    :return: List of the solutions found, each as a list of 81 values.
+    """
+    columns = {c: choices.copy() for c, choices in _COLUMNS.items()}
+    for k, value in enumerate(grid):
+        if value:
+            choice = k * 9 + value - 1
+            # A given which conflicts with an earlier one has already been removed
+            if choice not in columns[CELL_COLUMNS + k]:
+                return []
+            _select(columns, choice)
+
+    found = []
+    _search(columns, [], found, limit, monitor)
+    solutions = []
+    for chosen in found:
+        solution = list(grid)
+        for choice in chosen:
+            k, d = divmod(choice, 9)
+            solution[k] = d + 1
+        solutions.append(solution)
+    return solutions
+
+
+def _search(columns, chosen, found, limit, monitor) -> bool:
+    """
+    Depth-first search which appends every complete list of choices to `found`.
+    :return: True when `limit` solutions have been found and the search can stop.
+    """
+    if monitor is not None:
+        monitor()
+    if not columns:
+        found.append(chosen.copy())
+        return len(found) >= limit
+
+    # Branch on the constraint with the fewest remaining choices
+    column = None
+    fewest = 10
+    for c, choices in columns.items():
+        if len(choices) < fewest:
+            column = c
+            fewest = len(choices)
+            if fewest <= 1:
+                break
+    for choice in sorted(columns[column]):
+        removed = _select(columns, choice)
+        chosen.append(choice)
+        done = _search(columns, chosen, found, limit, monitor)
+        chosen.pop()
+        _deselect(columns, choice, removed)
+        if done:
+            return True
+    return False
+
+
+def _select(columns, choice) -> list:
+    """
+    Cover the columns of `choice` and remove every choice which conflicts with it.
+    :return: List of the removed column sets, needed by `_deselect`.
+    """
+    removed = []
+    for c in CHOICE_COLUMNS[choice]:
+        for other in columns[c]:
+            for c2 in CHOICE_COLUMNS[other]:
+                if c2 != c:
+                    columns[c2].remove(other)
+        removed.append(columns.pop(c))
+    return removed
+
+
+def _deselect(columns, choice, removed) -> None:
+    for c in reversed(CHOICE_COLUMNS[choice]):
+        columns[c] = removed.pop()
+        for other in columns[c]:
+            for c2 in CHOICE_COLUMNS[other]:
+                if c2 != c:
+                    columns[c2].add(other)
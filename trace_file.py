@@ -0,0 +1,265 @@
+import argparse
+import array
+import math
+import os
+import struct
+import sys
+import time
+import zlib
+
+import puzzle_io
+import solver
+
+# Trace file layout, all numbers little-endian:
+#   header - MAGIC, version, bytes per step, number of cells, steps per chunk and the
+#            puzzle as one byte per cell
+#   chunks - the grid before the first step of the chunk, one byte per cell, followed
+#            by the zlib compressed steps of the chunk, each `solver.trace_step` stored
+#            in 2 or 4 bytes
+#   index  - offset, compressed size and number of steps of every chunk
+#   footer - offset of the index, total number of steps and INDEX_MAGIC
+# Every chunk holds CHUNK_STEPS steps except the last one, so the chunk of a step is
+# found by a division and only that chunk is decoded to seek to it.
+MAGIC = b"SDKT"
+INDEX_MAGIC = b"SDKI"
+VERSION = 1
+CHUNK_STEPS = 4096
+_HEADER = struct.Struct("<4sBBHI")
+_INDEX_ENTRY = struct.Struct("<QII")
+_FOOTER = struct.Struct("<QQ4s")
+_LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+def _step_typecode(cells) -> str:
+    # A step is the cell shifted by 8 bits above the value and the kind
+    return "H" if cells <= 256 else "I"
+
+
+def _apply(grid, steps) -> None:
+    for step in steps:
+        grid[step >> 8] = 0 if step & 7 == solver.TRACE_UNDO else step >> 3 & 31
+
+
+class TraceWriter:
+    """
+    Stream the steps of a solve to a trace file. The writer can be given to
+    `solver.solve` as its `trace`, the steps are compressed and written a chunk at a
+    time while the solve runs. Call `close` or use the writer as a context manager
+    to write the index.
+    """
+    def __init__(self, path, puzzle, chunk_steps=CHUNK_STEPS):
+        """
+        :param path: File to create.
+        :param puzzle: List containing the lists of values of the each row, 0 for empty cells.
+        :param chunk_steps: Number of steps per chunk. Seeking decodes up to this many steps.
+        """
+        self.grid = bytearray(value for row in puzzle for value in row)
+        self.chunk_steps = chunk_steps
+        self.steps = 0
+        self._buffer = array.array(_step_typecode(len(self.grid)))
+        self._index = []
+        self._file = open(path, "wb")
+        self._file.write(_HEADER.pack(MAGIC, VERSION, self._buffer.itemsize, len(self.grid), chunk_steps))
+        self._file.write(self.grid)
+
+    def append(self, step) -> None:
+        self._buffer.append(step)
+        if len(self._buffer) >= self.chunk_steps:
+            self._flush()
+
+    def extend(self, steps) -> None:
+        for step in steps:
+            self.append(step)
+
+    def __len__(self):
+        return self.steps + len(self._buffer)
+
+    def _flush(self) -> None:
+        if not self._buffer:
+            return
+        data = self._buffer
+        if not _LITTLE_ENDIAN:
+            data = array.array(data.typecode, data)
+            data.byteswap()
+        compressed = zlib.compress(data.tobytes())
+        self._index.append((self._file.tell(), len(compressed), len(self._buffer)))
+        self._file.write(self.grid)
+        self._file.write(compressed)
+        # The grid before the next chunk
+        _apply(self.grid, self._buffer)
+        self.steps += len(self._buffer)
+        del self._buffer[:]
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        self._flush()
+        index_offset = self._file.tell()
+        for entry in self._index:
+            self._file.write(_INDEX_ENTRY.pack(*entry))
+        self._file.write(_FOOTER.pack(index_offset, self.steps, INDEX_MAGIC))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class TraceReader:
+    """
+    Random access to the steps of a trace file and to the grid after any step.
+    """
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        header = self._file.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            raise ValueError(f"{path} is not a trace file")
+        magic, version, step_size, self.cells, self.chunk_steps = _HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a trace file of version {VERSION}")
+        self._typecode = _step_typecode(self.cells)
+        if array.array(self._typecode).itemsize != step_size:
+            raise ValueError(f"{path} has steps of {step_size} bytes for {self.cells} cells")
+        self.puzzle = bytes(self._file.read(self.cells))
+
+        self._file.seek(-_FOOTER.size, 2)
+        index_offset, self.steps, magic = _FOOTER.unpack(self._file.read(_FOOTER.size))
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{path} has no index, the writer was not closed")
+        self._file.seek(index_offset)
+        chunks = -(-self.steps // self.chunk_steps)
+        data = self._file.read(chunks * _INDEX_ENTRY.size)
+        self._index = [_INDEX_ENTRY.unpack_from(data, n * _INDEX_ENTRY.size) for n in range(chunks)]
+        # The last chunk read, consecutive seeks mostly stay in the same chunk
+        self._chunk = None
+
+    def __len__(self):
+        return self.steps
+
+    @property
+    def chunks(self) -> int:
+        return len(self._index)
+
+    def read_chunk(self, n) -> tuple:
+        """
+        :return: Tuple (grid before the chunk, steps of the chunk as an array).
+        """
+        if self._chunk is not None and self._chunk[0] == n:
+            return self._chunk[1]
+        offset, size, count = self._index[n]
+        self._file.seek(offset)
+        grid = self._file.read(self.cells)
+        steps = array.array(self._typecode, zlib.decompress(self._file.read(size)))
+        if not _LITTLE_ENDIAN:
+            steps.byteswap()
+        if len(steps) != count:
+            raise ValueError(f"Chunk {n} of the trace is damaged")
+        self._chunk = (n, (grid, steps))
+        return grid, steps
+
+    def step(self, n) -> tuple:
+        """
+        :return: Tuple (kind, cell, value) of step `n`, counted from 0.
+        """
+        if not 0 <= n < self.steps:
+            raise IndexError("Step out of range")
+        return solver.decode_step(self.read_chunk(n // self.chunk_steps)[1][n % self.chunk_steps])
+
+    def iter_steps(self, start=0, stop=None):
+        """
+        Iterate the encoded steps from `start` to `stop`, decoding only their chunks.
+        """
+        stop = self.steps if stop is None else min(stop, self.steps)
+        while start < stop:
+            n, first = divmod(start, self.chunk_steps)
+            steps = self.read_chunk(n)[1]
+            end = min(len(steps), first + stop - start)
+            yield from steps[first:end]
+            start += end - first
+
+    def grid_at(self, position) -> bytearray:
+        """
+        Return the grid after the first `position` steps, one value per cell.
+        Only the chunk of the position is decoded.
+        """
+        position = max(0, min(position, self.steps))
+        if position == self.steps and position % self.chunk_steps == 0:
+            if not position:
+                return bytearray(self.puzzle)
+            # The grid after the last chunk is not stored
+            grid, steps = self.read_chunk(self.chunks - 1)
+            grid = bytearray(grid)
+            _apply(grid, steps)
+            return grid
+        grid, steps = self.read_chunk(position // self.chunk_steps)
+        grid = bytearray(grid)
+        _apply(grid, steps[:position % self.chunk_steps])
+        return grid
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def record(puzzle, path, chunk_steps=CHUNK_STEPS, **options):
+    """
+    Solve a puzzle and write the steps to a trace file.
+    :param options: Keyword arguments of `solver.solve`.
+    :return: Tuple (solution, number of steps).
+    """
+    with TraceWriter(path, puzzle, chunk_steps) as writer:
+        solution = solver.solve(puzzle, trace=writer, **options)
+        return solution, len(writer)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Record the steps of a sudoku solve to a trace file, or show the "
+                                                 "grid at some step of a trace.")
+    parser.add_argument("trace", help="trace file")
+    parser.add_argument("--record", default=None, metavar="PUZZLE_FILE",
+                        help="solve the first puzzle of this file, or - for standard input, into the trace")
+    parser.add_argument("--strategy", choices=sorted(solver.STRATEGIES), default="mrv",
+                        help="backtracking strategy of the recorded solve (default: mrv)")
+    parser.add_argument("--passes", default="", help="elimination passes of the recorded solve joined with +")
+    parser.add_argument("--step", type=int, default=None, help="show the grid after this many steps")
+    args = parser.parse_args(argv)
+    passes = args.passes.split("+") if args.passes else []
+    if any(name not in solver.PASSES for name in passes):
+        parser.error(f"invalid passes {args.passes!r}")
+
+    if args.record is not None:
+        puzzle = next(iter(puzzle_io.read_puzzles(args.record)), None)
+        if puzzle is None:
+            parser.error(f"no puzzle in {args.record}")
+        start = time.perf_counter()
+        solution, steps = record(puzzle, args.trace, strategy=args.strategy, passes=passes)
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(args.trace)
+        print(f"Recorded {steps} steps in {elapsed:.2f} s, {size} bytes ({size / max(steps, 1):.2f} bytes/step)"
+              f"{'' if solution else ', no solution'}", file=sys.stderr)
+
+    with TraceReader(args.trace) as reader:
+        if args.step is None:
+            print(f"{len(reader)} steps in {reader.chunks} chunks of {reader.chunk_steps}")
+            return 0
+        if not 0 <= args.step <= len(reader):
+            parser.error(f"step must be between 0 and {len(reader)}")
+        grid = reader.grid_at(args.step)
+        size = math.isqrt(reader.cells)
+        if args.step:
+            kind, k, value = reader.step(args.step - 1)
+            print(f"Step {args.step}: {solver.TRACE_KINDS[kind]} {puzzle_io.SYMBOLS[value - 1]} "
+                  f"at row {k // size + 1}, column {k % size + 1}")
+        print(puzzle_io.format_line([grid[size * i:size * i + size] for i in range(size)]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())